@@ -1,6 +1,10 @@
 """
 The analyze package handles the harmonic analysis.
 
+- `benchmark.py` compares the throughput of the analyzers.
 - `chords.py` contains the principle analysis runner (dynamic programming).
+- `jobs.py` contains a song-level job queue, to analyze all databases with any number of workers.
 - `preference_rules.py` contains the preference rules.
+- `roman.py` looks up the roman numerals of chord roots (in `roman_numerals.json`).
+- `viterbi.py` contains an exact (Viterbi) alternative to the analysis runner.
 """
\ No newline at end of file
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Compare the throughput of the harmonic analyzers on MIDI files.
+
+    $ python -m analyze.benchmark [-d DURK_STEP] [-a ANALYZERS] [-f] FILE.mid [FILE.mid ...]
+
+where:
+    - DURK_STEP is the number of durks between TimeInstances (default 4)
+    - ANALYZERS is a comma separated list of analyzers (default greedy,viterbi, see chords.analyzers), each
+      optionally followed by a TimeIterator mode (e.g. viterbi:runs)
+    - `-f` reads files with the streaming NumPy reader (see db.smf) instead of python-midi
+
+The files are parsed and labelled in memory (nothing is stored in the database). For every analyzer, the time
+taken by every song, the number of songs per second, and the share of notes that get the same root as with the
+first analyzer are printed.
+"""
+
+import time
+from optparse import OptionParser
+
+from db.helpers import MidiParser
+from iter import load_song
+from iter.benchmark import song_from_midi
+from chords import analyzers
+
+def bench(analyzer,songs):
+    """
+    Time the labelling of songs
+
+    Args:
+        analyzer (HarmonicAnalyzer): the analyzer
+        songs (LoadedSong[]): the songs
+
+    Returns:
+        tuple: (seconds per song, roots of the notes of every song)
+    """
+    elapsed,roots = [],[]
+    for song in songs:
+        start = time.time()
+        analyzer.label(song)
+        elapsed.append(time.time() - start)
+        roots.append([note.root for note in song.playing])
+    return elapsed,roots
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option("-d", "--durk-step", dest="durk_step", default=4, type="int")
+    parser.add_option("-a", "--analyzers", dest="analyzers", default="greedy,viterbi")
+    parser.add_option("-f", "--fast-parser", dest="fast", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    midi_parser = MidiParser(options.fast)
+    songs = [load_song(song_from_midi(midi_parser,midifilename)) for midifilename in args]
+
+    reference = None
+    for name in options.analyzers.split(','):
+        analyzer_name,mode = (name.split(':') + ['chords'])[:2]
+        analyzer = analyzers()[analyzer_name](options.durk_step,None,0,None,mode)
+        elapsed,roots = bench(analyzer,songs)
+
+        print "%s: %d songs in %.3fs, %.3f songs/sec" % (name, len(songs), sum(elapsed), len(songs) / sum(elapsed))
+        for midifilename,song,secs in zip(args,songs,elapsed):
+            print "\t%-40s %8d notes %8.3fs" % (midifilename, len(song.playing), secs)
+
+        # agreement with the first analyzer
+        if reference is None:
+            reference = roots
+        else:
+            pairs = [(a,b) for song_a,song_b in zip(reference,roots) for a,b in zip(song_a,song_b)]
+            same = sum(1 for a,b in pairs if a == b)
+            print "\tsame root as %s: %d / %d notes" % (options.analyzers.split(',')[0], same, len(pairs))
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,16 @@
-from db import get_engines,get_sessions,Song,Track,Note
-from iter import TimeIterator
+from db import EngineRegistry,get_sessions,Song,Track,Note
+from db.engines import check_budget
+from db.streaming import stream_values
+from iter import TimeIterator,load_song,labels,write_labels
 from utils import Counter
 from sqlalchemy.orm import sessionmaker
 
 from preference_rules import *
+from roman import roman_numeral
+from jobs import run_jobs
 
 import music21,sys
+import numpy as np
 from optparse import OptionParser
 from multiprocessing import Process,Queue
 
@@ -13,6 +18,9 @@ class ChordSpan(object):
     """
     A ChordSpan is a series of TimeInstances that all have the same root.
     Each ChordSpan also maintains a pointer (prev_cs) to the previous ChordSpan computed in the song.
+
+    Once a ChordSpan is final, it labels its notes and lets go of its TimeInstances (see finish): only its root,
+    score and time range stay in the chain.
     """
     def __init__(self,initial_ts,prev_cs):
         """
@@ -25,6 +33,9 @@ class ChordSpan(object):
         self.tss = [initial_ts]
         self.root = None
 
+        # time of the first / last TimeInstance, set by finish()
+        self.start,self.end = None,None
+
         # a back-pointer to the previous best chord-span
         self.prev_cs = prev_cs
 
@@ -85,37 +96,48 @@ class ChordSpan(object):
             the Music21 Roman Numeral object.
         """
 
-        pitch = music21.key.sharpsToPitch(track.key_sig_top)
-        key = music21.key.Key(pitch)
-
-        if track.key_sig_bottom == 0:
-            scale = music21.scale.MajorScale(self.root.name)
-        else:
-            scale = music21.scale.MelodicMinorScale(self.root.name)
-
-        chord = music21.chord.Chord([scale.chord.root(),scale.chord.third,scale.chord.fifth])
+        return roman_numeral(self.root,track)
 
-        return music21.roman.romanNumeralFromChord(chord,key).scaleDegree
-
-    def label(self,depth=0):
+    def finish(self,labelled):
         """
-        Label all the notes in this ChordSpan with the determined root.
+        Label all the notes in this (final) ChordSpan with the determined root, then let go of its TimeInstances.
 
-        Then proceed to recursively label the preceding ChordSpan
+        Args:
+            labelled: the notes labelled so far. A note in several ChordSpans keeps the root of the first one.
         """
         rn = None
         # label all the notes in this chord span
         for note in self.notes():
             if self.root:
-                note.root = self.root.midi
-                note.iso_root = self.root.name
                 if not rn:
                     rn = self.roman_numeral(note.track)
-                note.roman = rn
+                if note not in labelled:
+                    labelled.add(note)
+                    note.root = self.root.midi
+                    note.iso_root = self.root.name
+                    note.roman = rn
 
-        # label the previous chord span (assuming we haven't surpassed max recursion limit)
-        if self.prev_cs and depth < sys.getrecursionlimit() - 1:
-            self.prev_cs.label()
+        self.start,self.end = self.tss[0].time,self.last_ts().time
+        self.tss = None
+
+    def label(self,labelled=None):
+        """
+        Label all the notes in this ChordSpan with the determined root, as well as those of the preceding
+        ChordSpans that are not finished yet (iteratively, from the first one on).
+
+        Args:
+            labelled: the notes labelled so far (see finish)
+        """
+        chain = []
+        cs = self
+        while cs and cs.tss is not None:
+            chain.append(cs)
+            cs = cs.prev_cs
+
+        if labelled is None:
+            labelled = set()
+        for cs in reversed(chain):
+            cs.finish(labelled)
 
     def pr_score(self,m_root):
         """
@@ -145,6 +167,26 @@ class ChordSpan(object):
 
         return STRENGTH_MULTIPLIER * stren + COMPATIBILITY_MULTIPLIER * comp_score + LOF_MULTIPLIER * lof
 
+    def pr_scores(self):
+        """
+        Calculate the preference rule score of every candidate root at once (see pr_score)
+
+        Returns:
+            numpy.ndarray: the score obtained using each of ROOTS as a root
+        """
+        ts_notes = self.last_ts().notes()
+
+        # the beat strength does not depend on the root
+        stren = beat_strength(ts_notes)
+
+        # compatibility scores
+        comp_scores = compatibility_vector(ts_notes)
+
+        # difference from previous chord root on line of fifths
+        lof = (lof_vector(self.prev_cs.root) if self.prev_cs else 0)
+
+        return STRENGTH_MULTIPLIER * stren + COMPATIBILITY_MULTIPLIER * comp_scores + LOF_MULTIPLIER * lof
+
     def calc_best_root(self):
         """
         Calculate the best root for this chord span
@@ -156,13 +198,12 @@ class ChordSpan(object):
         # start with C, weight of 0
         best_root,best_weight = music21.note.Note('C'),-len(line_of_fifths)
 
-        # try all possible roots
-        for m_root in music21.scale.ChromaticScale('C').pitches:
+        # score all possible roots: the first of the best ones wins
+        scores = self.pr_scores()
+        i = int(np.argmax(scores))
 
-            val = self.pr_score(m_root)
-
-            if val > best_weight:
-                best_root,best_weight = m_root,val
+        if scores[i] > best_weight:
+            best_root,best_weight = ROOTS[i],float(scores[i])
 
         # use this as the chord-span root
         self.root = best_root
@@ -171,9 +212,6 @@ class ChordSpan(object):
         prev_cs_score = (self.prev_cs.score if self.prev_cs else 0)
         return prev_cs_score + best_weight
 
-# increased recursion limit for dynamic programming back-pointer labelling process
-RECURSION_LIMIT = 10000
-
 class HarmonicAnalyzer(Process):
     """
     Run Harmonic Analysis in a separate process.
@@ -181,88 +219,137 @@ class HarmonicAnalyzer(Process):
     Such an approach is heavily inspired by the work of Daniel Sleater and David Temperley at CMU
         in their Melisma Music Analyzer: http://www.link.cs.cmu.edu/melisma/
     """
-    def __init__(self,durk_step,engine,counter):
+    def __init__(self,durk_step,engines,shard,counter,mode='chords'):
         """
         Initialize the Harmonic Analyzer process
 
         Args:
             durk_step: steps between TimeInstances
-            engine: the database engine to draw songs from
+            engines (EngineRegistry): the database engines. The engine is created once the process is running.
+            shard: index of the database to draw songs from
             counter (Counter): atomic song counter
+            mode (str): the TimeIterator mode. In the 'runs' mode, every run of identical steps is considered once.
         """
         # Initialize the Process
         Process.__init__(self)
 
-        # time step used in TimeIterator
+        # time step and mode used in TimeIterator
         self.durk_step = durk_step
+        self.mode = mode
 
-        # session to pull songs from
-        Session = sessionmaker(bind=engine)
-        self.session = Session()
+        # database to pull songs from
+        self.engines = engines
+        self.shard = shard
 
         # Counter object representing number of songs that have been processed
         self.counter = counter
-	
-	# increase the recursion limit
-	sys.setrecursionlimit(RECURSION_LIMIT)
+
+    def connect(self):
+        """
+        Open the session to database self.shard. Called once the process is running.
+        """
+        Session = sessionmaker(bind=self.engines[self.shard])
+        self.session = Session()
 
     def run(self):
         """
         Start the Process. Note that this method overrides Process.run()
         """
+        # session to pull songs from
+        self.connect()
 
-        # Iterate through every song in the database attached to this process
-        for song in self.session.query(Song).all():
+        # Stream the ids of the songs still to analyze, and load the songs one at a time
+        for song_id in stream_values(self.engines[self.shard],Song.id,Song.analyzed.isnot(True)):
+            self.process(song_id)
 
-            # Atomically increment the song counter
-            count = self.counter.incrementAndGet()
-            print count, ". ", song
+    def process(self,song_id):
+        """
+        Analyze a song, and mark it as analyzed
 
-            # skip songs that have already been analyzed
-            if song.analyzed:
-                print count, ". Already analyzed. Skipping."
-                continue
+        Args:
+            song_id: id of the song (in database self.shard)
 
-            # and run the analysis
-            try:
-                self.analyze(song)
+        Returns:
+            int: the number of notes labelled, or None if the analysis failed
+        """
+        song = self.session.query(Song).get(song_id)
 
-                # mark this song as analyzed
-                song.analyzed = True
-                self.session.commit()
-            except Exception,e:
-                sys.stderr.write("Exception when processing " + str(song) + ":\n")
-                sys.stderr.write("\t" + str(e) + "\n")
+        # Atomically increment the song counter
+        count = self.counter.incrementAndGet()
+        print count, ". ", song
+
+        # and run the analysis
+        try:
+            num_labels = self.analyze(song)
+
+            # mark this song as analyzed, in the same transaction as its labels
+            song.analyzed = True
+            self.session.commit()
+        except Exception,e:
+            self.session.rollback()
+            sys.stderr.write("Exception when processing " + str(song) + ":\n")
+            sys.stderr.write("\t" + str(e) + "\n")
+            num_labels = None
+
+        # let go of the song and its notes
+        self.session.expunge_all()
+        return num_labels
 
     def analyze(self,song):
         """
-        Run Harmonic Analysis on a particular Song
+        Run Harmonic Analysis on a particular Song, and store the labels (without committing)
 
         Args:
             song (Song): the song to analyze
+
+        Returns:
+            int: the number of notes labelled (0 if the song was skipped)
+        """
+        # read-only note records: the labels are written back by note id once the song is labelled
+        loaded = load_song(song,records=True)
+
+        if not self.label(loaded):
+            return 0
+
+        return write_labels(self.session,labels(loaded.playing))
+
+    def label(self,loaded):
+        """
+        Label the notes of a song with their roots (without touching the database)
+
+        Args:
+            loaded (LoadedSong): the song
+
+        Returns:
+            bool: False if the song could not be analyzed
         """
         cs,idx = None,0
+        labelled = set()
 
-	try:
-		# construct the iterator
-		ti = TimeIterator(song,self.durk_step)
-	except ValueError,e:
-		# something is very wrong with this song... let's skip it!
-		sys.stderr.write("Exception when processing " + str(song) + ":\n")
-                sys.stderr.write("\t" + str(e) + "\n")
-		return False
+        try:
+            # construct the iterator
+            ti = TimeIterator(loaded,self.durk_step,self.mode)
+        except ValueError,e:
+            # something is very wrong with this song... let's skip it!
+            sys.stderr.write("Exception when processing " + str(loaded.song) + ":\n")
+            sys.stderr.write("\t" + str(e) + "\n")
+            return False
 
         # iterate through every TimeInstance in the song
         for ts in ti:
 
             # and consider what to do...
-            cs = self.consider_ts(cs,ts)
+            prev_cs,cs = cs,self.consider_ts(cs,ts)
             # print idx, ts, "--", cs.score, ":", cs
             idx += 1
 
-        cs.label()
-        self.session.commit()
+            # a new ChordSpan was started: the previous one will not change anymore
+            if prev_cs and cs is not prev_cs:
+                prev_cs.finish(labelled)
 
+        if cs:
+            cs.label(labelled)
+        return True
 
     def consider_ts(self,cs,ts):
         """
@@ -307,9 +394,23 @@ class HarmonicAnalyzer(Process):
 
         return res
 
+def analyzers():
+    """
+    The available analyzers
+
+    Returns:
+        dict: name -> HarmonicAnalyzer (sub)class
+    """
+    # imported here, as viterbi.py builds on this module
+    from viterbi import ViterbiAnalyzer
+    return {'greedy': HarmonicAnalyzer, 'viterbi': ViterbiAnalyzer}
+
 def main():
     """
     Run harmonic analysis on all songs in all databases. This will take a LONG time.
+
+    By default one analyzer process walks each database; with -w, a pool of workers pulls songs from all databases
+    (see jobs.py).
     """
     parser = OptionParser()
 
@@ -317,21 +418,33 @@ def main():
     parser.add_option("-t", "--pool-size", dest="pool_size", default=8, type="int")
     parser.add_option("-u", "--username", dest="db_username", default="postgres")
     parser.add_option("-p", "--password", dest="db_password", default="postgres")
+    parser.add_option("-a", "--analyzer", dest="analyzer", default="greedy", choices=sorted(analyzers()))
+    parser.add_option("-m", "--mode", dest="mode", default="chords",
+                      help="TimeIterator mode: 'chords', 'sweep' or 'runs' (event-driven, see iter.sweep)")
+    parser.add_option("-w", "--workers", dest="workers", default=0, type="int",
+                      help="analyze songs from all databases with this many worker processes (see jobs.py)")
     (options, args) = parser.parse_args()
 
-
-    print "Creating", options.pool_size, "processes."
-    processes = []
-
     # Initialize the counter to 0
     counter = Counter(0)
 
-    # get all database engines
-    engines = get_engines(options.pool_size,options.db_username,options.db_password)
+    # get all database engines. Every process creates its own once it is running
+    engines = EngineRegistry(options.pool_size,options.db_username,options.db_password)
+    Analyzer = analyzers()[options.analyzer]
+
+    if options.workers > 0:
+        # every worker may connect to every database
+        check_budget(engines,options.workers)
+        run_jobs(engines,Analyzer,options.durk_step,options.workers,counter,mode=options.mode)
+        print engines.report()
+        return
 
-    # Construct a new HarmonicAnalyzer process for each database.
+    print "Creating", options.pool_size, "processes."
+    processes = []
+
+    # Construct a new analyzer process for each database.
     for i in xrange(options.pool_size):
-        p = HarmonicAnalyzer(options.durk_step,engines[i],counter)
+        p = Analyzer(options.durk_step,engines,i,counter,options.mode)
         processes.append(p)
 
     # Start the processes
@@ -343,5 +456,7 @@ def main():
     for p in processes:
         p.join()
 
+    print engines.report()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,226 @@
+"""
+A song-level job queue for harmonic analysis over all databases.
+
+With one HarmonicAnalyzer per database, a run lasts as long as the largest database takes, and cannot use more
+cores than there are databases. Here a dispatcher (the main process) lists the songs still to analyze in every
+database, and hands them out one at a time to any number of SongWorker processes, each of which can analyze
+songs from any database:
+
+- a worker asks for a song whenever it is idle, so fast workers take more songs (no database runs long),
+- the dispatcher knows which song every worker holds: if a worker dies (crash, OOM kill, ...), its song is
+  handed out again (up to `retries` times) and a new worker takes its place, and
+- every worker keeps its own Throughput counters (songs analyzed, notes labelled, busy / idle time).
+
+Songs whose analysis raises an exception are logged and skipped (see HarmonicAnalyzer.process), as they would
+fail again.
+"""
+
+import sys,time
+from collections import deque
+from multiprocessing import Process,Queue
+from Queue import Empty
+
+from db import Song
+from db.streaming import stream_values
+from utils import Throughput
+
+# number of times the song of a crashed worker is handed out again
+RETRIES = 2
+
+def interleave(jobs):
+    """
+    Merge lists of jobs, taking one from each list in turn (so that all databases are busy at the same time)
+
+    Args:
+        jobs: the lists
+
+    Returns:
+        list: the merged jobs
+    """
+    res = []
+    for i in xrange(max(len(j) for j in jobs) if jobs else 0):
+        res.extend(j[i] for j in jobs if i < len(j))
+    return res
+
+class SongWorker(Process):
+    """
+    An analysis worker process. Analyzes the songs handed to it by the dispatcher (see run_jobs), from any database.
+    """
+    def __init__(self,worker_id,inbox,results,Analyzer,durk_step,engines,counter,stats,mode='chords'):
+        """
+        Initialize a SongWorker
+
+        Args:
+            worker_id: id of the worker, sent along with every message to the dispatcher
+            inbox: the queue of (shard, song id) jobs for this worker (None tells the process to stop)
+            results: the queue of messages to the dispatcher
+            Analyzer: the analyzer class (HarmonicAnalyzer or a subclass, see chords.analyzers)
+            durk_step: steps between TimeInstances
+            engines (EngineRegistry): the database engines. The engines are created once the process is running.
+            counter (Counter): atomic song counter
+            stats (Throughput): the counters of this worker
+            mode (str): the TimeIterator mode
+        """
+        Process.__init__(self)
+        self.worker_id = worker_id
+        self.inbox = inbox
+        self.results = results
+        self.Analyzer = Analyzer
+        self.durk_step = durk_step
+        self.engines = engines
+        self.counter = counter
+        self.stats = stats
+        self.mode = mode
+
+    def analyzer(self,shard):
+        """
+        The analyzer of a database, connected on first use
+
+        Args:
+            shard: index of the database
+
+        Returns:
+            HarmonicAnalyzer: the analyzer (used in this process, it is not started)
+        """
+        if shard not in self.analyzers:
+            analyzer = self.Analyzer(self.durk_step,self.engines,shard,self.counter,self.mode)
+            analyzer.connect()
+            self.analyzers[shard] = analyzer
+        return self.analyzers[shard]
+
+    def run(self):
+        """
+        Start the process
+        """
+        self.analyzers = {}
+
+        # ask for the first job
+        self.results.put((self.worker_id,None,None))
+        while True:
+            start = time.time()
+            job = self.inbox.get()
+            got_at = time.time()
+
+            if job is None:
+                break
+
+            shard,song_id = job
+            num_labels = self.analyzer(shard).process(song_id)
+
+            self.stats.record(items=1 if num_labels is not None else 0,rows=num_labels or 0,
+                              busy=time.time() - got_at,waiting=got_at - start)
+
+            # report the outcome, which also asks for the next job
+            self.results.put((self.worker_id,job,num_labels is not None))
+
+def run_jobs(engines,Analyzer,durk_step,num_workers,counter,retries=RETRIES,report_interval=60,mode='chords'):
+    """
+    Analyze the songs of all databases with a pool of SongWorkers, printing per-worker throughput along the way.
+
+    Args:
+        engines (EngineRegistry): the database engines
+        Analyzer: the analyzer class (see chords.analyzers)
+        durk_step: steps between TimeInstances
+        num_workers: number of worker processes
+        counter (Counter): atomic song counter
+        retries: number of times the song of a crashed worker is handed out again
+        report_interval: seconds between throughput reports
+        mode (str): the TimeIterator mode
+
+    Returns:
+        tuple: (number of songs analyzed, number of songs that failed or were given up on)
+    """
+    # the songs still to analyze, as (shard, song id)
+    pending = deque(interleave([[(shard,song_id) for song_id in stream_values(engine,Song.id,Song.analyzed.isnot(True))]
+                                for shard,engine in enumerate(engines)]))
+    print "Analyzing", len(pending), "songs with", num_workers, "workers."
+
+    results = Queue()
+    workers = {}    # worker id -> SongWorker
+    assigned = {}   # worker id -> job the worker holds
+    attempts = {}   # job -> number of crashed attempts
+    idle = []       # ids of the workers waiting for a job
+    stats = []      # Throughput of every worker ever started
+    done,failed = [0],[0]
+
+    def start_worker():
+        worker_id = len(stats)
+        stats.append(Throughput("worker %d" % worker_id))
+        workers[worker_id] = SongWorker(worker_id,Queue(),results,Analyzer,durk_step,engines,counter,stats[-1],
+                                       mode)
+        workers[worker_id].start()
+
+    def dispatch(worker_id):
+        if pending:
+            assigned[worker_id] = pending.popleft()
+            workers[worker_id].inbox.put(assigned[worker_id])
+        else:
+            idle.append(worker_id)
+
+    def check_workers():
+        for worker_id,worker in workers.items():
+            if worker.is_alive():
+                continue
+            del workers[worker_id]
+            job = assigned.pop(worker_id,None)
+            if worker_id in idle:
+                idle.remove(worker_id)
+            sys.stderr.write("Worker %d died (exit code %r) holding %r\n" % (worker_id, worker.exitcode, job))
+
+            if job is not None:
+                attempts[job] = attempts.get(job,0) + 1
+                if attempts[job] <= retries:
+                    pending.appendleft(job)
+                else:
+                    sys.stderr.write("Giving up on song %d of database %d\n" % (job[1], job[0]))
+                    failed[0] += 1
+
+            # replace the worker
+            if pending or assigned:
+                start_worker()
+
+        # hand out the jobs given back by dead workers
+        while idle and pending:
+            dispatch(idle.pop())
+
+    start = time.time()
+    last_report = start
+
+    def report():
+        elapsed = time.time() - start
+        for s in stats:
+            print s.report(elapsed)
+        print "%d songs analyzed, %d failed, %d to go" % (done[0], failed[0], len(pending) + len(assigned))
+
+    for i in xrange(num_workers):
+        start_worker()
+
+    while pending or assigned:
+        try:
+            worker_id,job,ok = results.get(timeout=1)
+        except Empty:
+            check_workers()
+            continue
+
+        if job is not None and assigned.get(worker_id) == job:
+            del assigned[worker_id]
+            if ok:
+                done[0] += 1
+            else:
+                failed[0] += 1
+        if worker_id in workers:
+            dispatch(worker_id)
+
+        check_workers()
+        if time.time() - last_report > report_interval:
+            report()
+            last_report = time.time()
+
+    # stop the workers
+    for worker in workers.values():
+        worker.inbox.put(None)
+    for worker in workers.values():
+        worker.join()
+
+    report()
+    return done[0],failed[0]
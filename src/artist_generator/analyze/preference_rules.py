@@ -1,4 +1,13 @@
+"""
+Temperley's preference rules for harmonic analysis.
+
+The rules only depend on the spelled pitches of the notes and on the candidate root, so compatibility and
+lof_difference read precomputed tables: music21 is only used to build them, when this module is imported.
+"""
+
 import music21,sys
+import numpy as np
+from audiolazy import midi2str
 
 # in choosing roots for chord-spans, prefer certain TPC-root relationships over others, in the following order:
 # 1, 5, 3, b3, b7, b5, b9, ornamental
@@ -22,6 +31,41 @@ def _dual_compatibility(m_root,m_note):
     except ValueError,e:
         return 0
 
+# the candidate roots of a ChordSpan (see ChordSpan.calc_best_root), in the order they are tried
+ROOTS = music21.scale.ChromaticScale('C').pitches
+ROOT_INDEX = dict((root.nameWithOctave,i) for i,root in enumerate(ROOTS))
+
+def _compatibility_row(iso_pitch):
+    """
+    The HPR 1 scores of a spelled pitch against every candidate root
+
+    Args:
+        iso_pitch (str): the spelled pitch (e.g. 'C#4')
+
+    Returns:
+        list: the score against each of ROOTS, or None if music21 cannot read the spelling
+    """
+    try:
+        m_note = music21.note.Note(iso_pitch)
+    except music21.pitch.AccidentalException:
+        return None
+    return [_dual_compatibility(root,m_note) for root in ROOTS]
+
+# spelled pitch -> scores against ROOTS, for the spellings stored in the note table (see db.helpers).
+# Other spellings are added the first time they are seen.
+COMPATIBILITY = dict((iso_pitch,_compatibility_row(iso_pitch)) for iso_pitch in
+                     (midi2str(pitch) for pitch in xrange(128)))
+
+def _lookup(iso_pitch):
+    """
+    The row of COMPATIBILITY for a spelled pitch, added on first use
+    """
+    try:
+        return COMPATIBILITY[iso_pitch]
+    except KeyError:
+        row = COMPATIBILITY[iso_pitch] = _compatibility_row(iso_pitch)
+        return row
+
 def compatibility(notes,m_root):
     """
     Calculate the compatibility of m_root and each note in notes
@@ -38,8 +82,17 @@ def compatibility(notes,m_root):
 
     comp = []
 
+    r = ROOT_INDEX.get(m_root.nameWithOctave)
+
     # iterate through all notes, adding each score to comp[]
     for note in notes:
+        if r is not None:
+            row = _lookup(note.iso_pitch)
+            if row is not None:
+                comp.append(row[r])
+                continue
+
+        # not in the table: a root that is not a candidate, or a spelling music21 cannot read
         try:
             m_note = music21.note.Note(note.iso_pitch)
             comp.append(_dual_compatibility(m_root,m_note))
@@ -51,6 +104,41 @@ def compatibility(notes,m_root):
     # return the average of the scores obtained.
     return sum(comp) / float(len(notes))
 
+# the table as a matrix (spelling x root) for compatibility_vector. Spellings music21 cannot read score 0 against
+# every root: compatibility() skips them but still counts them in the average.
+SPELLINGS = sorted(COMPATIBILITY)
+SPELLING_INDEX = dict((iso_pitch,i) for i,iso_pitch in enumerate(SPELLINGS))
+COMPATIBILITY_MATRIX = np.array([COMPATIBILITY[iso_pitch] or [0] * len(ROOTS) for iso_pitch in SPELLINGS],
+                                dtype='i8')
+
+def compatibility_vector(notes):
+    """
+    Calculate the compatibility of every candidate root and the notes at once: the spelling histogram of the
+    notes, dotted with COMPATIBILITY_MATRIX.
+
+    Args:
+        notes (Note[]): the Notes in the ChordSpan
+
+    Returns:
+        numpy.ndarray: the score of each of ROOTS, equal to [compatibility(notes,root) for root in ROOTS]
+    """
+    if not notes:
+        return np.zeros(len(ROOTS))
+
+    counts = np.zeros(len(SPELLINGS),dtype='i8')
+    scores = np.zeros(len(ROOTS),dtype='i8')
+    for note in notes:
+        i = SPELLING_INDEX.get(note.iso_pitch)
+        if i is not None:
+            counts[i] += 1
+        else:
+            # a spelling that is not in the matrix
+            row = _lookup(note.iso_pitch)
+            if row is not None:
+                scores += row
+
+    return (scores + counts.dot(COMPATIBILITY_MATRIX)) / float(len(notes))
+
 def beat_strength(notes):
     """
     The strength of the note corresponds to where it lies relative to 1,1/2,1/4 notes...
@@ -79,6 +167,9 @@ def beat_strength(notes):
 
 line_of_fifths = ["B#","E#","A#","D#","G#","C#","F#","B","E","A","D","G","C","F","B-","E-","A-","D-","G-","C-","F-"]
 
+# note name -> position on the line of fifths
+LOF_POSITION = dict((name,i) for i,name in enumerate(line_of_fifths))
+
 def lof_difference(m_prev,m_note):
     """
     return the difference between two notes on the line of fifths.
@@ -89,12 +180,39 @@ def lof_difference(m_prev,m_note):
 
     Returns:
         int: the difference in position on LOF
+
+    Raises:
+        ValueError: if a note is not on the line of fifths (e.g. a double sharp)
     """
-    prev_pos = line_of_fifths.index(m_prev.name)
-    note_pos = line_of_fifths.index(m_note.name)
+    try:
+        prev_pos = LOF_POSITION[m_prev.name]
+        note_pos = LOF_POSITION[m_note.name]
+    except KeyError,e:
+        raise ValueError("%s is not on the line of fifths" % e)
 
     return abs(note_pos - prev_pos)
 
+# position of every candidate root on the line of fifths
+ROOT_LOF = np.array([LOF_POSITION[root.name] for root in ROOTS],dtype='i8')
+
+def lof_vector(m_prev):
+    """
+    return the difference between a note and every candidate root on the line of fifths.
+
+    Args:
+        m_prev (music21.note.Note): the previous root
+
+    Returns:
+        numpy.ndarray: the difference of each of ROOTS, equal to [lof_difference(m_prev,root) for root in ROOTS]
+
+    Raises:
+        ValueError: if m_prev is not on the line of fifths
+    """
+    try:
+        return np.abs(ROOT_LOF - LOF_POSITION[m_prev.name])
+    except KeyError,e:
+        raise ValueError("%s is not on the line of fifths" % e)
+
 # PARAMETERS TO THE MODEL:
 COMPATIBILITY_MULTIPLIER = 1
 LOF_MULTIPLIER = -1
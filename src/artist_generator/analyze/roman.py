@@ -0,0 +1,130 @@
+"""
+Roman numerals of chord roots, from a precomputed table.
+
+The roman numeral of a ChordSpan only depends on the key signature of its track (number of sharps, major /
+minor) and on the name of its root: 15 x 2 x 12 combinations. Computing one with music21 takes ~0.1s, so they
+are all computed once and shipped in roman_numerals.json. To rebuild the file:
+
+    $ python -m analyze.roman
+"""
+
+import json,os
+import music21
+
+from preference_rules import ROOTS
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),'roman_numerals.json')
+
+KEY_SIGNATURES = range(-7,8)
+"""list: numbers of sharps (negative for flats) of the key signatures in the table"""
+
+MODES = ('major','minor')
+
+ROOT_NAMES = sorted(set(root.name for root in ROOTS))
+"""list: names of the roots in the table"""
+
+def signed_sharps(key_sig_top):
+    """
+    The number of sharps of a Track's key signature
+
+    Args:
+        key_sig_top (int): the key signature as stored, an unsigned byte (flats are 249 to 255, see python-midi)
+
+    Returns:
+        int: the number of sharps, negative for flats
+    """
+    return key_sig_top - 256 if key_sig_top > 127 else key_sig_top
+
+def mode(key_sig_bottom):
+    """
+    The mode of a Track's key signature
+
+    Args:
+        key_sig_bottom (int): 0 for major keys
+
+    Returns:
+        str: 'major' or 'minor'
+    """
+    return 'major' if key_sig_bottom == 0 else 'minor'
+
+def compute_roman_numeral(key_sig_top,key_mode,root_name):
+    """
+    Calculate the roman numeral of a root with music21
+
+    Args:
+        key_sig_top (int): number of sharps of the key signature
+        key_mode (str): 'major' or 'minor'
+        root_name (str): name of the root (e.g. 'E-')
+
+    Returns:
+        int: the scale degree of the roman numeral
+    """
+    pitch = music21.key.sharpsToPitch(key_sig_top)
+    key = music21.key.Key(pitch)
+
+    if key_mode == 'major':
+        scale = music21.scale.MajorScale(root_name)
+    else:
+        scale = music21.scale.MelodicMinorScale(root_name)
+
+    chord = music21.chord.Chord([scale.chord.root(),scale.chord.third,scale.chord.fifth])
+
+    return music21.roman.romanNumeralFromChord(chord,key).scaleDegree
+
+def build_table():
+    """
+    Compute the roman numerals of every key signature, mode and root
+
+    Returns:
+        dict: (key_sig_top, mode, root name) -> scale degree
+    """
+    return dict(((top,key_mode,name),compute_roman_numeral(top,key_mode,name))
+                for top in KEY_SIGNATURES for key_mode in MODES for name in ROOT_NAMES)
+
+def load_table(filename=TABLE_FILE):
+    """
+    Read the table shipped in roman_numerals.json
+
+    Returns:
+        dict: (key_sig_top, mode, root name) -> scale degree
+    """
+    with open(filename) as f:
+        table = json.load(f)
+    return dict(((int(top),str(key_mode),str(name)),degree)
+                for top,modes in table.iteritems() for key_mode,names in modes.iteritems()
+                for name,degree in names.iteritems())
+
+def save_table(table,filename=TABLE_FILE):
+    """
+    Write a table (see build_table) as roman_numerals.json: {key_sig_top: {mode: {root name: degree}}}
+    """
+    res = {}
+    for (top,key_mode,name),degree in table.iteritems():
+        res.setdefault(str(top),{}).setdefault(key_mode,{})[name] = degree
+    with open(filename,'w') as f:
+        json.dump(res,f,indent=1,sort_keys=True,separators=(',',': '))
+        f.write('\n')
+
+ROMAN_NUMERALS = load_table() if os.path.exists(TABLE_FILE) else {}
+"""dict: (key_sig_top, mode, root name) -> scale degree. Other combinations are computed when first seen."""
+
+def roman_numeral(root,track):
+    """
+    Look up the roman numeral of a root in the key of a track
+
+    Args:
+        root (music21.pitch.Pitch): the root
+        track: the Track (or TrackRecord) giving the key signature
+
+    Returns:
+        int: the scale degree of the roman numeral
+    """
+    key = (signed_sharps(track.key_sig_top),mode(track.key_sig_bottom),root.name)
+    try:
+        return ROMAN_NUMERALS[key]
+    except KeyError:
+        degree = ROMAN_NUMERALS[key] = compute_roman_numeral(*key)
+        return degree
+
+if __name__ == '__main__':
+    save_table(build_table())
@@ -0,0 +1,162 @@
+"""
+An exact dynamic-programming alternative to the greedy ChordSpan analysis.
+
+HarmonicAnalyzer decides, TimeInstance by TimeInstance, whether to extend the current ChordSpan or to start a
+new one, and never revisits a decision. The ViterbiAnalyzer instead finds the sequence of roots (one per
+TimeInstance) with the best total score over the whole song:
+
+- every TimeInstance scores STRENGTH_MULTIPLIER * beat_strength + COMPATIBILITY_MULTIPLIER * compatibility
+  with its root (the emission scores), and
+- every change of root costs LOF_MULTIPLIER * lof_difference (the transition scores),
+
+and consecutive TimeInstances with the same root form a chord span. In the 'runs' mode of TimeIterator, a
+TimeInstance of weight w stands for w identical steps: its emission scores are multiplied by w. As changing roots
+within a run of identical steps never scores better than keeping the best of its roots (the LOF distance is a
+metric), this gives the same best score as considering every step. The labels are the same too, except where
+several root sequences tie for the best score: the two passes may then pick different (equally good) roots for
+a few notes. The emission scores of all TimeInstances are computed at once with NumPy; the back-pointers are
+kept in a (TimeInstances x roots) array.
+"""
+
+import sys
+import numpy as np
+
+from iter import TimeIterator
+from chords import HarmonicAnalyzer
+from preference_rules import *
+from roman import roman_numeral
+
+# the candidate roots: ROOTS ends with C5, a duplicate of C4, which would only be an extra state splitting ties
+NUM_ROOTS = len(set(root.name for root in ROOTS))
+
+# score of moving from root i (row) to root j (column)
+TRANSITIONS = LOF_MULTIPLIER * np.abs(ROOT_LOF[:NUM_ROOTS,None] - ROOT_LOF[None,:NUM_ROOTS])
+
+def emissions(instances):
+    """
+    Score every candidate root for every TimeInstance
+
+    Args:
+        instances: the notes of every TimeInstance (a list of Note lists)
+
+    Returns:
+        numpy.ndarray: (TimeInstances, roots) scores, with the first NUM_ROOTS of ROOTS as columns
+    """
+    sizes = np.array([len(notes) for notes in instances],dtype='i8')
+    owner = np.repeat(np.arange(len(instances)),sizes)
+    notes = [note for ts_notes in instances for note in ts_notes]
+
+    # spelling histogram of every TimeInstance
+    spelling = np.array([SPELLING_INDEX.get(note.iso_pitch,-1) for note in notes],dtype='i8')
+    known = spelling >= 0
+    counts = np.zeros((len(instances),len(SPELLINGS)),dtype='i8')
+    np.add.at(counts,(owner[known],spelling[known]),1)
+    comp = counts.dot(COMPATIBILITY_MATRIX).astype('f8')
+
+    # spellings that are not in the matrix (see compatibility_vector)
+    for i in np.flatnonzero(~known):
+        comp[owner[i]] += compatibility_vector([notes[i]])
+
+    comp /= np.maximum(sizes,1)[:,None]
+
+    # beat strength (see beat_strength)
+    start = np.array([note.start for note in notes],dtype='i8')
+    strength = np.where(start % 32 == 0,3,np.where(start % 16 == 0,2,np.where(start % 8 == 0,1,0)))
+    stren = np.bincount(owner,weights=strength,minlength=len(instances))
+
+    return STRENGTH_MULTIPLIER * stren[:,None] + COMPATIBILITY_MULTIPLIER * comp[:,:NUM_ROOTS]
+
+def viterbi(scores,transitions=TRANSITIONS,weights=None):
+    """
+    Find the sequence of roots with the best total score
+
+    Args:
+        scores: (TimeInstances, roots) emission scores (see emissions)
+        transitions: (roots, roots) transition scores
+        weights: the number of steps every TimeInstance stands for (default: 1 each)
+
+    Returns:
+        tuple: (index of the root of every TimeInstance, total score)
+    """
+    if weights is not None:
+        scores = scores * np.asarray(weights,dtype='f8')[:,None]
+
+    num_steps,num_roots = scores.shape
+    columns = np.arange(num_roots)
+
+    # back[t,j]: the best root of TimeInstance t - 1, given root j for TimeInstance t
+    back = np.zeros((num_steps,num_roots),dtype='i4')
+    best = scores[0].copy()
+    for t in xrange(1,num_steps):
+        candidates = best[:,None] + transitions
+        back[t] = candidates.argmax(axis=0)
+        best = candidates[back[t],columns] + scores[t]
+
+    path = np.empty(num_steps,dtype='i4')
+    path[-1] = best.argmax()
+    for t in xrange(num_steps - 1,0,-1):
+        path[t - 1] = back[t,path[t]]
+
+    return path,float(best[path[-1]])
+
+def spans(path):
+    """
+    Group consecutive TimeInstances with the same root
+
+    Args:
+        path: the root index of every TimeInstance (see viterbi)
+
+    Returns:
+        list: (root index, first TimeInstance, end TimeInstance (excluded)) of every chord span
+    """
+    bounds = np.concatenate(([0],np.flatnonzero(np.diff(path)) + 1,[len(path)]))
+    return [(int(path[start]),int(start),int(end)) for start,end in zip(bounds[:-1],bounds[1:])]
+
+class ViterbiAnalyzer(HarmonicAnalyzer):
+    """
+    Run Harmonic Analysis in a separate process, with an exact Viterbi pass over every song instead of the
+    greedy ChordSpan segmentation of HarmonicAnalyzer
+    """
+    def label(self,loaded):
+        """
+        Label the notes of a song with their roots (without touching the database)
+
+        Args:
+            loaded (LoadedSong): the song
+
+        Returns:
+            bool: False if the song could not be analyzed
+        """
+        try:
+            tss = [(ts.notes(),ts.weight) for ts in TimeIterator(loaded,self.durk_step,self.mode)]
+        except ValueError,e:
+            # something is very wrong with this song... let's skip it!
+            sys.stderr.write("Exception when processing " + str(loaded.song) + ":\n")
+            sys.stderr.write("\t" + str(e) + "\n")
+            return False
+
+        if not tss:
+            return True
+
+        instances = [notes for notes,weight in tss]
+        path,score = viterbi(emissions(instances),weights=[weight for notes,weight in tss])
+
+        # as with ChordSpan.label, a note in several spans keeps the root of the first one, and the roman
+        # numeral of a span is taken in the key of the track of its first note
+        labelled = set()
+        for r,start,end in spans(path):
+            notes = [note for ts_notes in instances[start:end] for note in ts_notes]
+            if not notes:
+                continue
+
+            root = ROOTS[r]
+            rn = roman_numeral(root,notes[0].track)
+
+            for note in notes:
+                if note not in labelled:
+                    labelled.add(note)
+                    note.root = root.midi
+                    note.iso_root = root.name
+                    note.roman = rn
+
+        return True
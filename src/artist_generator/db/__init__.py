@@ -4,19 +4,29 @@ The db package contains model definitions for
 - `song.py`
 - `track.py`: a line of music in a Song with a single time signature, key signature, instrument key
 - `note.py`
+- `manifest.py`: a record of the MIDI files that have already been ingested
 
 and
 
 - `helpers.py` for parsing the MIDI files (this is the exciting part !),
+- `smf.py` for reading MIDI files straight into NumPy arrays,
+- `bulk.py` for storing parsed songs with bulk inserts,
+- `pipeline.py` for running the parser as separate parse / write stages,
 - `midi_store.py` for running the parser,
-- `reset.py` for creating / dropping databases.
+- `shard.py` for placing songs on databases by content hash, and `rebalance.py` for evening them out,
+- `shard_set.py` for running a query on all databases at once,
+- `columnar.py` for exporting the notes into a memory-mapped columnar store,
+- `engines.py` for fork-safe, lazily created engines with metered connection pools,
+- `streaming.py` for scanning a database with server-side cursors,
+- `reset.py` for creating / dropping databases, and `migrate.py` for adding new tables / indexes to existing ones.
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from engines import EngineRegistry
 
 def get_engines(num,usr="postgres",pwd="postgres"):
     """
-    Get engines for num different databases
+    Get engines for num different databases, for use in the current process.
+    Worker processes should be handed an EngineRegistry instead (see engines.py).
+
     Args:
         num: number of databases
         usr: database username
@@ -25,15 +35,12 @@ def get_engines(num,usr="postgres",pwd="postgres"):
     Returns:
         engine[]: the database engines
     """
-    engines = []
-    for i in xrange(num):
-        engines.append(create_engine("postgresql://" + usr + ":" + pwd
-                               + "@localhost:5432/artist_" + str(i), pool_size=20, max_overflow=100))
-    return engines
+    return list(EngineRegistry(num,usr,pwd))
 
 def get_sessions(num,usr="postgres",pwd="postgres"):
     """
-    Get sessions for num different databases
+    Get sessions for num different databases, for use in the current process.
+
     Args:
         num: number of databases
         usr: database username
@@ -42,16 +49,15 @@ def get_sessions(num,usr="postgres",pwd="postgres"):
     Returns:
         Session[]: the database sessions
     """
-    engines = get_engines(num,usr,pwd)
-    sessions = []
-    for engine in engines:
-        Session = sessionmaker(bind=engine)
-        sessions.append(Session())
-    return sessions
+    registry = EngineRegistry(num,usr,pwd)
+    return [registry.session(i) for i in xrange(num)]
 
 from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
 from song import Song
 from track import Track
-from note import Note
\ No newline at end of file
+from note import Note
+from manifest import Manifest
+from shard import ShardRouter
+from shard_set import ShardSet
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Bulk loading of parsed songs into the database, bypassing the ORM unit of work.
+
+Songs are handed to the BulkWriter as plain tuples (see TRACK_COLUMNS and NOTE_COLUMNS).
+On PostgreSQL, Track ids are reserved from the sequence in a single query and the rows are streamed in with COPY.
+On other backends, we fall back on `executemany` core inserts.
+"""
+
+from cStringIO import StringIO
+from sqlalchemy import text
+
+from . import Song,Track,Note,Manifest
+
+TRACK_COLUMNS = ('time_sig_top','time_sig_bottom','key_sig_top','key_sig_bottom','instr_key','instr_name','channel','start_tick')
+"""tuple: layout of a track row, as produced by helpers.MidiParser.midi_to_rows"""
+
+NOTE_COLUMNS = ('pitch','iso_pitch','dur','start','end','tick_dur','start_tick','measure')
+"""tuple: layout of a note row, as produced by helpers.MidiParser.midi_to_rows"""
+
+def _copy_value(val):
+    """
+    Format a single value for the PostgreSQL COPY text format
+
+    Args:
+        val: the value to format
+
+    Returns:
+        str: the escaped value (NULL is written as \\N)
+    """
+    if val is None:
+        return '\\N'
+    if isinstance(val,basestring):
+        return val.replace('\\','\\\\').replace('\t','\\t').replace('\n','\\n').replace('\r','\\r')
+    return str(val)
+
+def _copy_buffer(rows):
+    """
+    Serialize rows into a file-like object suitable for COPY FROM STDIN
+
+    Args:
+        rows: list of tuples
+
+    Returns:
+        StringIO: the tab-separated rows
+    """
+    buf = StringIO()
+    for row in rows:
+        buf.write('\t'.join(_copy_value(val) for val in row))
+        buf.write('\n')
+    buf.seek(0)
+    return buf
+
+class BulkWriter(object):
+    """
+    Write whole songs to the database with one bulk statement per table.
+    """
+    def __init__(self,engine):
+        """
+        Initialize a BulkWriter
+
+        Args:
+            engine: the database engine into which we store the songs
+        """
+        self.engine = engine
+        self.use_copy = (engine.dialect.name == 'postgresql')
+
+    def reserve_ids(self,conn,table,num):
+        """
+        Reserve num primary keys from the sequence backing table.id in a single round-trip.
+
+        Args:
+            conn: the connection to use
+            table: the Table whose ids to reserve
+            num: number of ids to reserve
+
+        Returns:
+            int[]: the reserved ids
+        """
+        if num == 0:
+            return []
+        res = conn.execute(text("SELECT nextval('" + table.name + "_id_seq') FROM generate_series(1, :num)"),num=num)
+        return [row[0] for row in res]
+
+    def copy(self,conn,table,columns,rows):
+        """
+        Stream rows into table using COPY FROM STDIN
+
+        Args:
+            conn: the connection to use (COPY runs in its transaction)
+            table: the Table to copy into
+            columns: the names of the columns in each row
+            rows: list of tuples
+        """
+        if not rows:
+            return
+        # copy_from leaves the column names unquoted, and note.end is a reserved word
+        quote = conn.dialect.identifier_preparer.quote
+        statement = "COPY %s (%s) FROM STDIN" % (quote(table.name), ", ".join(quote(column) for column in columns))
+
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(statement,_copy_buffer(rows))
+        finally:
+            cursor.close()
+
+    def write_failure(self,manifest):
+        """
+        Record a file that could not be parsed in the manifest
+
+        Args:
+            manifest: column values of the Manifest entry (see manifest.manifest_values)
+        """
+        self.engine.execute(Manifest.__table__.insert().values(**manifest))
+
+    def write(self,title,ppqn,tracks,manifest=None):
+        """
+        Store a song in a single transaction.
+
+        Args:
+            title: title of the song
+            ppqn: pulses per quarter note
+            tracks: list of (track_row, note_rows), laid out as TRACK_COLUMNS and NOTE_COLUMNS
+            manifest: column values of the Manifest entry to record with the song (optional)
+
+        Returns:
+            int: number of rows written
+        """
+        conn = self.engine.connect()
+        trans = conn.begin()
+        try:
+            song_id = conn.execute(Song.__table__.insert().values(title=title,ppqn=ppqn)).inserted_primary_key[0]
+
+            if self.use_copy:
+                # grab all Track ids at once, so that Note rows can reference them
+                track_ids = self.reserve_ids(conn,Track.__table__,len(tracks))
+                self.copy(conn,Track.__table__,('id','song_id') + TRACK_COLUMNS,
+                          [(track_id,song_id) + track_row for track_id,(track_row,note_rows) in zip(track_ids,tracks)])
+            else:
+                track_ids = []
+                for track_row,note_rows in tracks:
+                    values = dict(zip(TRACK_COLUMNS,track_row),song_id=song_id)
+                    track_ids.append(conn.execute(Track.__table__.insert().values(**values)).inserted_primary_key[0])
+
+            note_rows = []
+            for track_id,(track_row,rows) in zip(track_ids,tracks):
+                for row in rows:
+                    note_rows.append(row + (track_id,))
+
+            if self.use_copy:
+                self.copy(conn,Note.__table__,NOTE_COLUMNS + ('track_id',),note_rows)
+            elif note_rows:
+                conn.execute(Note.__table__.insert(),[dict(zip(NOTE_COLUMNS + ('track_id',),row)) for row in note_rows])
+
+            if manifest:
+                conn.execute(Manifest.__table__.insert().values(song_id=song_id,**manifest))
+
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return 1 + len(tracks) + len(note_rows)
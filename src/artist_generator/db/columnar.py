@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+A columnar, memory-mapped copy of the notes stored in the artist_N databases.
+
+    $ python -m db.columnar -o OUTDIR [-t DBPOOL_SIZE] [-u USERNAME] [-p PASSWORD]
+
+where:
+    - OUTDIR is where the store is written
+    - DBPOOL_SIZE is the number of databases
+    - USERNAME is the database username
+    - PASSWORD is the database password
+
+The store is three .npy files of NumPy structured arrays:
+
+- `notes.npy` (NOTE_DTYPE): every note (rests excluded), grouped by song then track, ordered by (start, dur)
+  within a track,
+- `tracks.npy` (TRACK_DTYPE): one row per track with the offset / count of its notes, and
+- `songs.npy` (SONG_DTYPE): one row per song with the offset / count of its notes and tracks.
+
+ColumnarStore memory-maps these files and hands out zero-copy views per song or track, so analysis and training
+can stream the whole corpus without touching the database.
+"""
+
+import os
+import numpy as np
+from optparse import OptionParser
+from sqlalchemy import select, func
+
+from . import get_engines,Song,Track,Note
+
+NOTE_DTYPE = np.dtype([('id','i4'),('pitch','i2'),('start','i4'),('dur','i4'),('track','i4'),('song','i4'),
+                       ('shard','i2'),('key_sig_top','i2'),('key_sig_bottom','i2'),('root','i2'),('roman','i2')])
+"""numpy.dtype: a note. track, song and shard are database ids / indexes. NULL root / roman are stored as NULL_VALUE."""
+
+TRACK_DTYPE = np.dtype([('id','i4'),('song','i4'),('shard','i2'),('key_sig_top','i2'),('key_sig_bottom','i2'),
+                        ('channel','i2'),('note_offset','i8'),('note_count','i8')])
+"""numpy.dtype: a track, with the position of its notes in notes.npy"""
+
+SONG_DTYPE = np.dtype([('id','i4'),('shard','i2'),('ppqn','i4'),('analyzed','?'),('note_offset','i8'),
+                       ('note_count','i8'),('track_offset','i8'),('track_count','i8')])
+"""numpy.dtype: a song, with the position of its notes in notes.npy and its tracks in tracks.npy"""
+
+NULL_VALUE = -32768
+"""int: stands in for NULL root / roman"""
+
+FETCH_SIZE = 50000
+"""int: number of rows fetched from the database at a time"""
+
+def _null(val):
+    return NULL_VALUE if val is None else val
+
+def export(engines,outdir):
+    """
+    Export the notes of all databases into a columnar store
+
+    Args:
+        engines: the database engines
+        outdir: directory in which to write notes.npy, tracks.npy and songs.npy
+    """
+    song_t,track_t,note_t = Song.__table__,Track.__table__,Note.__table__
+    in_song = track_t.c.song_id != None
+    playing = (note_t.c.pitch >= 0) & in_song
+
+    # size the arrays up front
+    num_notes = sum(engine.execute(select([func.count()]).select_from(note_t.join(track_t)).where(playing)).scalar()
+                    for engine in engines)
+    num_tracks = sum(engine.execute(select([func.count()]).select_from(track_t).where(in_song)).scalar()
+                     for engine in engines)
+    num_songs = sum(engine.execute(select([func.count()]).select_from(song_t)).scalar() for engine in engines)
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    open_memmap = np.lib.format.open_memmap
+    notes = open_memmap(os.path.join(outdir,'notes.npy'),mode='w+',dtype=NOTE_DTYPE,shape=(num_notes,))
+    tracks = open_memmap(os.path.join(outdir,'tracks.npy'),mode='w+',dtype=TRACK_DTYPE,shape=(num_tracks,))
+    songs = open_memmap(os.path.join(outdir,'songs.npy'),mode='w+',dtype=SONG_DTYPE,shape=(num_songs,))
+
+    n_idx,t_idx,s_idx = 0,0,0
+    for shard,engine in enumerate(engines):
+        # songs and tracks, in the order their notes will be written
+        for row in engine.execute(select([song_t.c.id,song_t.c.ppqn,song_t.c.analyzed]).order_by(song_t.c.id)):
+            songs[s_idx] = (row.id,shard,row.ppqn,bool(row.analyzed),0,0,0,0)
+            s_idx += 1
+        query = select([track_t.c.id,track_t.c.song_id,track_t.c.key_sig_top,track_t.c.key_sig_bottom,track_t.c.channel]) \
+            .where(in_song).order_by(track_t.c.song_id,track_t.c.id)
+        for row in engine.execute(query):
+            tracks[t_idx] = (row.id,row.song_id,shard,row.key_sig_top,row.key_sig_bottom,row.channel,0,0)
+            t_idx += 1
+
+        # stream the notes in (song, track, start, dur) order
+        query = select([note_t.c.id,note_t.c.pitch,note_t.c.start,note_t.c.dur,note_t.c.track_id,track_t.c.song_id,
+                        track_t.c.key_sig_top,track_t.c.key_sig_bottom,note_t.c.root,note_t.c.roman]) \
+            .select_from(note_t.join(track_t)).where(playing) \
+            .order_by(track_t.c.song_id,note_t.c.track_id,note_t.c.start,note_t.c.dur)
+        res = engine.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = res.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunk = np.array([(r[0],r[1],r[2],r[3],r[4],r[5],shard,r[6],r[7],_null(r[8]),_null(r[9])) for r in rows],
+                             dtype=NOTE_DTYPE)
+            notes[n_idx:n_idx + len(chunk)] = chunk
+            n_idx += len(chunk)
+
+    _index(notes,tracks,songs)
+
+    notes.flush()
+    tracks.flush()
+    songs.flush()
+
+def _index(notes,tracks,songs):
+    """
+    Fill in the note / track offsets of tracks and songs.
+    Relies on notes and tracks being grouped in the same (shard, song, track) order as songs.
+
+    Args:
+        notes: the note array
+        tracks: the track array
+        songs: the song array
+    """
+    def runs(keys,targets):
+        # offset / count of every target key in the (grouped) keys
+        if len(keys) == 0:
+            return np.zeros(len(targets),dtype='i8'),np.zeros(len(targets),dtype='i8')
+        bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        starts = np.concatenate(([0],bounds))
+        counts = np.diff(np.concatenate((starts,[len(keys)])))
+        found = dict(zip(keys[starts].tolist(),zip(starts.tolist(),counts.tolist())))
+        res = [found.get(key,(0,0)) for key in targets.tolist()]
+        return np.array([r[0] for r in res],dtype='i8'),np.array([r[1] for r in res],dtype='i8')
+
+    def key(shard,ident):
+        return shard.astype('i8') << 32 | ident.astype('i8')
+
+    tracks['note_offset'],tracks['note_count'] = runs(key(notes['shard'],notes['track']),key(tracks['shard'],tracks['id']))
+    songs['note_offset'],songs['note_count'] = runs(key(notes['shard'],notes['song']),key(songs['shard'],songs['id']))
+    songs['track_offset'],songs['track_count'] = runs(key(tracks['shard'],tracks['song']),key(songs['shard'],songs['id']))
+
+class ColumnarStore(object):
+    """
+    Read-only access to a store written by export(). Every accessor returns a view into the memory-mapped arrays.
+    """
+    def __init__(self,directory):
+        """
+        Open a store
+
+        Args:
+            directory: the directory containing notes.npy, tracks.npy and songs.npy
+        """
+        self.notes = np.load(os.path.join(directory,'notes.npy'),mmap_mode='r')
+        self.tracks = np.load(os.path.join(directory,'tracks.npy'),mmap_mode='r')
+        self.songs = np.load(os.path.join(directory,'songs.npy'),mmap_mode='r')
+
+        # (shard, song id) => row in self.songs
+        self.song_index = dict(((int(s['shard']),int(s['id'])),i) for i,s in enumerate(self.songs))
+
+    def __len__(self):
+        return len(self.songs)
+
+    def __iter__(self):
+        """
+        Iterate through all songs
+
+        Returns:
+            iterator: (song row, note view) for every song
+        """
+        for i in xrange(len(self.songs)):
+            yield self.songs[i],self.song_notes(i)
+
+    def find_song(self,shard,song_id):
+        """
+        Find a song by database index and id
+
+        Args:
+            shard: index of the database
+            song_id: id of the song in that database
+
+        Returns:
+            int: row of the song in self.songs
+        """
+        return self.song_index[(shard,song_id)]
+
+    def song_notes(self,i):
+        """
+        The notes of a song, grouped by track and ordered by (start, dur) within a track
+
+        Args:
+            i: row of the song in self.songs
+
+        Returns:
+            numpy.ndarray: a view of NOTE_DTYPE records
+        """
+        song = self.songs[i]
+        return self.notes[song['note_offset']:song['note_offset'] + song['note_count']]
+
+    def song_tracks(self,i):
+        """
+        The tracks of a song
+
+        Args:
+            i: row of the song in self.songs
+
+        Returns:
+            numpy.ndarray: a view of TRACK_DTYPE records
+        """
+        song = self.songs[i]
+        return self.tracks[song['track_offset']:song['track_offset'] + song['track_count']]
+
+    def track_notes(self,j):
+        """
+        The notes of a track, ordered by (start, dur)
+
+        Args:
+            j: row of the track in self.tracks
+
+        Returns:
+            numpy.ndarray: a view of NOTE_DTYPE records
+        """
+        track = self.tracks[j]
+        return self.notes[track['note_offset']:track['note_offset'] + track['note_count']]
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option("-o", "--outdir", dest="outdir")
+    parser.add_option("-t", "--pool-size", dest="pool_size", default=8, type="int")
+    parser.add_option("-u", "--username", dest="db_username", default="postgres")
+    parser.add_option("-p", "--password", dest="db_password", default="postgres")
+    (options, args) = parser.parse_args()
+
+    export(get_engines(options.pool_size,options.db_username,options.db_password),options.outdir)
+
+    store = ColumnarStore(options.outdir)
+    print "Exported", len(store.songs), "songs,", len(store.tracks), "tracks,", len(store.notes), "notes."
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+class UnreadableMidiFile(Exception):
+    """
+    Exception to raise when a MIDI file cannot be read.
+    """
+    def __init__(self, reason):
+        Exception.__init__(self, reason)
@@ -19,78 +19,171 @@ Important MIDI Notes:
 2) pattern.resolution contains resolution (ppqn)
 '''
 
-import midi, sys, pdb, os, re,threading
+import midi, sys, pdb, os, re,threading,time
 
 from collections import defaultdict
 from audiolazy import midi2str
 from sqlalchemy.orm import sessionmaker
 from multiprocessing import Process
 
-from . import Song,Track,Note
+from . import Song,Track,Note,Manifest
+from bulk import BulkWriter,TRACK_COLUMNS,NOTE_COLUMNS
+from manifest import STORED,FAILED,manifest_values
+from exceptions import UnreadableMidiFile
+from smf import read_smf,pair_notes
 
 DURKS_PER_QUARTER_NOTE = 8
 
-class Runner(Process):
+# positions of note row fields (see bulk.NOTE_COLUMNS)
+_START,_END,_START_TICK = [NOTE_COLUMNS.index(col) for col in ('start','end','start_tick')]
+
+# iso_pitch of every MIDI pitch
+ISO_PITCHES = [midi2str(pitch) for pitch in xrange(128)]
+
+class MidiParser(object):
     """
-    A database worker process. Parses MIDI files pulled from self.q and stores them in the database specified by self.engine.
+    Parses MIDI files into plain Track / Note rows (see bulk.TRACK_COLUMNS and bulk.NOTE_COLUMNS).
+    Holds no database state, so it can be used by parse-only workers (see pipeline.py).
     """
-
-    def __init__(self,q,engine,counter):
+    def __init__(self,fast=False):
         """
-        Initialize a Runner
+        Initialize a MidiParser
+
         Args:
-            q: the queue of MIDI file names
-            engine: the database engine into which we store the Notes
-            counter: count the number of songs that have been parsed.
+            fast: if True, read files with the streaming NumPy reader (see smf.py) rather than python-midi
         """
-        Process.__init__(self)
-        self.q = q
-        Session = sessionmaker(bind=engine)
-        self.session = Session()
-        self.counter = counter
+        self.fast = fast
 
-    def run(self):
+    def midi_to_rows(self,midifilename,rests=True):
         """
-        Start the process
-        """
-        while True:
-            midiPath = self.q.get()
+        Takes midi file and returns its Tracks and Notes as plain tuples, without touching the database.
 
-            count = self.counter.incrementAndGet()
-            print str(count) + ". Analyzing " + midiPath.split('/')[-1]
-            self.midi_to_song(midiPath)
-            print "Finished " + midiPath.split('/')[-1]
+        Args:
+            midifilename: filename of the MIDI file to parse
+            rests: if True, rest rows are appended to the note rows of every track
+
+        Returns:
+            tuple: (title, ppqn, tracks) where tracks is a list of (track_row, note_rows), laid out as
+            bulk.TRACK_COLUMNS and bulk.NOTE_COLUMNS.
 
-    def midi_to_song(self,midifilename):
+        Raises:
+            UnreadableMidiFile: if the file could not be parsed
         """
-        Takes midi file and returns a representative song object
+        if self.fast:
+            return self.smf_to_rows(midifilename,rests)
 
-        - a Song is a list of many Tracks
-        - a Track is a list of many Notes representing a common 1) key signature, 2) time signature, and 3) instrument key
+        pattern = self.read_pattern(midifilename)
+
+        resolution = pattern.resolution  # note pattern.resolution contains resolution (ppqn)
+        title = re.sub(r'[^\x00-\x7F]+', ' ', os.path.basename(midifilename))
+
+        time_sig_events,key_sig_events = self.get_sig_events(pattern)
+
+        # iterate thru tracks
+        # create appropriate track and note structure
+        tracks = []
+        for midi_track in pattern:
+            instr_track_data = self.is_instr_track(midi_track)
+            if instr_track_data:
+                instr_key = instr_track_data[0]
+                instr_name = re.sub(r'[^\x00-\x7F]+', ' ', instr_track_data[1])  # converts non-ASCII chars to spaces
+                channel = instr_track_data[2]
+
+                note_rows = self.pair_note_events(self.get_note_events(midi_track), resolution,
+                                                  time_sig_events[0]['d'], instr_name)
+
+                for ts,ks,start_tick,rows in self.segment_notes(note_rows,time_sig_events,key_sig_events):
+                    track_row = (ts['n'], ts['d'], ks['sf'], ks['mi'], instr_key, instr_name, channel, start_tick)
+                    if rests:
+                        rows = rows + self.get_rests(rows, ts['d'])
+                    tracks.append((track_row, rows))
+
+        return title,resolution,tracks
+
+    def smf_to_rows(self,midifilename,rests=True):
+        """
+        Same as midi_to_rows, but reads the file with smf.read_smf and pairs / quantises the note events with
+        vectorised operations (smf.pair_notes).
 
         Args:
-            midifilename: filename of the MIDI file to parse and store in the database
+            midifilename: filename of the MIDI file to parse
+            rests: if True, rest rows are appended to the note rows of every track
+
+        Returns:
+            tuple: (title, ppqn, tracks), as midi_to_rows
+
+        Raises:
+            UnreadableMidiFile: if the file could not be parsed
         """
+        smf = read_smf(midifilename)
+
+        resolution = smf.resolution
+        title = re.sub(r'[^\x00-\x7F]+', ' ', os.path.basename(midifilename))
+
+        time_sig_events = [{'start_tick': tick, 'n': n, 'd': 2**d, 'type': 'time'}
+                           for trk in smf.tracks for tick,n,d in trk.time_sigs]
+        key_sig_events = [{'start_tick': tick, 'sf': sf, 'mi': mi, 'type': 'key'}
+                          for trk in smf.tracks for tick,sf,mi in trk.key_sigs]
+        time_sig_events,key_sig_events = self.sort_sig_events(time_sig_events,key_sig_events)
+
+        tracks = []
+        for trk in smf.tracks:
+            if trk.programs:  # only act if actual instrument track!
+                tick,channel,instr_key = trk.programs[-1]
+                instr_name = re.sub(r'[^\x00-\x7F]+', ' ', trk.name)  # converts non-ASCII chars to spaces
+
+                events = trk.note_events()
+                cols = pair_notes(events, resolution, time_sig_events[0]['d'])
+                for idx in cols['unmatched_offs']:
+                    measure = events[idx,1] / (resolution * time_sig_events[0]['d'])
+                    print 'Warning: <get_notes> NoteOffEvent without corresponding NoteOnEvent %r, measure: %r, instr: %r, pitch: %r ' % (str(tuple(events[idx])), str(measure), instr_name, str(events[idx,2]))
+
+                pitches = cols['pitch'].tolist()
+                note_rows = zip(pitches, [ISO_PITCHES[pitch] for pitch in pitches], cols['dur'].tolist(),
+                                cols['start'].tolist(), cols['end'].tolist(), cols['tick_dur'].tolist(),
+                                cols['start_tick'].tolist(), cols['measure'].tolist())
+
+                for ts,ks,start_tick,rows in self.segment_notes(note_rows,time_sig_events,key_sig_events):
+                    track_row = (ts['n'], ts['d'], ks['sf'], ks['mi'], instr_key, instr_name, channel, start_tick)
+                    if rests:
+                        rows = rows + self.get_rests(rows, ts['d'])
+                    tracks.append((track_row, rows))
+
+        return title,resolution,tracks
+
+    def read_pattern(self,midifilename):
+        """
+        Read a MIDI file, with absolute ticks
+
+        Args:
+            midifilename: filename of the MIDI file to read
+
+        Returns:
+            midi.Pattern: the pattern
 
+        Raises:
+            UnreadableMidiFile: if the file could not be read
+        """
         try:
             pattern = midi.read_midifile(midifilename)
         except Exception as e:
-            print 'Exception: ' + str(e)
-            return
+            raise UnreadableMidiFile(str(e))
 
         pattern.make_ticks_abs()  # makes ticks absolute instead of relative
-        resolution = pattern.resolution  # note pattern.resolution contains resolution (ppqn)
+        return pattern
 
-        title = re.sub(r'[^\x00-\x7F]+', ' ', os.path.basename(midifilename))
+    def get_sig_events(self,pattern):
+        """
+        Create ordered lists of all time and key signature events in a pattern
 
-        # create Song object
-        song = Song(title=title, ppqn=resolution)
-        self.session.add(song)
+        Args:
+            pattern (midi.Pattern): the pattern to scan
 
-        # create ordered list of all time and key signature events
+        Returns:
+            tuple: (time_sig_events, key_sig_events), each sorted by start_tick and never empty
+        """
         time_sig_events = []
         key_sig_events = []
-        all_sig_events = []
 
         for track in pattern:
             for event in track:
@@ -101,6 +194,19 @@ class Runner(Process):
                     key_sig = {'start_tick': event.tick, 'sf': event.data[0], 'mi': event.data[1], 'type': 'key'}  # see track.py
                     key_sig_events.append(key_sig)
 
+        return self.sort_sig_events(time_sig_events,key_sig_events)
+
+    def sort_sig_events(self,time_sig_events,key_sig_events):
+        """
+        Sort time and key signature events, adding the MIDI defaults if there are none
+
+        Args:
+            time_sig_events: time signature events
+            key_sig_events: key signature events
+
+        Returns:
+            tuple: (time_sig_events, key_sig_events), each sorted by start_tick and never empty
+        """
         time_sig_events.sort(key=lambda x: x['start_tick'])
         key_sig_events.sort(key=lambda x: x['start_tick'])
 
@@ -114,132 +220,82 @@ class Runner(Process):
         if len(time_sig_events) == 0:
             time_sig_events.append({'start_tick': 0, 'n': 4, 'd': 4, 'type': 'time'})
 
-        # iterate thru tracks
-        # create appropriate song, track, and note structure
-        for midi_track in pattern:
-            instr_track_data = self.is_instr_track(midi_track)
-            if instr_track_data:
-                instr_key = instr_track_data[0]
-                instr_name = instr_track_data[1]
-                channel = instr_track_data[2]
-
-                # Create temporary copy of time_sig_events and key_sig_events
-                temp_time_sig_events = time_sig_events[:]
-                temp_key_sig_events = key_sig_events[:]
-
-                # Note: this assumes that a key and time signature are intialized at tick 0!
-                ts = temp_time_sig_events.pop(0)  # holds current time signature
-                ks = temp_key_sig_events.pop(0)  # holds current key signature
-
-                all_sig_events = temp_time_sig_events + temp_key_sig_events
-                all_sig_events.sort(key=lambda x: x['start_tick'])
-
-                instr_name = re.sub(r'[^\x00-\x7F]+', ' ', instr_name)  # converts non-ASCII chars to spaces
-
-                track = Track(time_sig_top=ts['n'], time_sig_bottom=ts['d'], key_sig_top=ks['sf'],
-                              key_sig_bottom=ks['mi'], instr_key=instr_key, instr_name=instr_name,
-                              channel=channel, start_tick=0, song=song)
-                self.session.add(track)
-
-                # init these next temp vars in case no sig events left
-                next_sig_event = None
-                next_track_tick = sys.maxint
-
-                if len(all_sig_events) > 0:
-                    next_sig_event = all_sig_events[0]
-                    next_track_tick = next_sig_event['start_tick']  # holds max tick of current track
+        return time_sig_events,key_sig_events
 
-                notes = self.get_notes(self.get_note_events(midi_track), resolution, track)
+    def segment_notes(self,note_rows,time_sig_events,key_sig_events):
+        """
+        Split the note rows of a MIDI track into segments that share a single key and time signature.
+        Each segment becomes a Track.
 
-                for n in notes:
-                    if not n.start_tick < next_track_tick:  # still on current track
-                        # update key or time signature
-                        if next_sig_event['type'] == 'key':
-                            ks = next_sig_event
-                        elif next_sig_event['type'] == 'time':
-                            ts = next_sig_event
+        Args:
+            note_rows: note rows (see bulk.NOTE_COLUMNS) of the MIDI track
+            time_sig_events: sorted time signature events (see get_sig_events)
+            key_sig_events: sorted key signature events (see get_sig_events)
 
-                        self.insert_rests_into_track(track, resolution)  # insert rests into track
+        Returns:
+            list: (time_sig, key_sig, start_tick, note_rows) for every segment
+        """
+        # Note: this assumes that a key and time signature are intialized at tick 0!
+        ts = time_sig_events[0]  # holds current time signature
+        ks = key_sig_events[0]  # holds current key signature
 
-                        instr_name = re.sub(r'[^\x00-\x7F]+', ' ', instr_name)  # converts non-ASCII chars to spaces
+        all_sig_events = time_sig_events[1:] + key_sig_events[1:]
+        all_sig_events.sort(key=lambda x: x['start_tick'])
 
-                        # create new track and update temporary variables
-                        track = Track(time_sig_top=ts['n'], time_sig_bottom=ts['d'], key_sig_top=ks['sf'],
-                                      key_sig_bottom=ks['mi'], instr_key=instr_key, instr_name=instr_name,
-                                      channel=channel, start_tick=next_sig_event['start_tick'], song=song)
-                        self.session.add(track)
+        segment = (ts, ks, 0, [])
+        segments = [segment]
 
-                        all_sig_events.pop(0)
+        for row in note_rows:
+            if all_sig_events and not row[_START_TICK] < all_sig_events[0]['start_tick']:  # past the current track
+                # update key or time signature
+                next_sig_event = all_sig_events.pop(0)
+                if next_sig_event['type'] == 'key':
+                    ks = next_sig_event
+                elif next_sig_event['type'] == 'time':
+                    ts = next_sig_event
 
-                        if len(all_sig_events) > 0:
-                            next_sig_event = all_sig_events[0]
-                            next_track_tick = next_sig_event['start_tick']
-                        else:  # if no events left, set next_track_tick to maxint
-                            next_sig_event = None
-                            next_track_tick = sys.maxint
+                segment = (ts, ks, next_sig_event['start_tick'], [])
+                segments.append(segment)
 
-                    n.track = track
-                    self.session.add(n)
+            segment[3].append(row)
 
-                self.insert_rests_into_track(track, resolution)  # insert rests into track
-        self.session.commit()
-        return song
+        return segments
 
-    def insert_rests_into_track(self,track, ppqn):
+    def get_rests(self,note_rows,time_sig_bottom):
         """
-        Take a Track object, inserts rest inot the appropriate locations (where no pitch is being played)
+        Compute the rest rows of a track (where no pitch is being played), from its in-memory note rows.
 
-        Warnings:
-            Directly modifies the Track object that is passed to it!
+        Notes:
+            sweeps the note intervals sorted by start, merging overlapping notes and emitting the gaps.
+            O(n log n) in the number of notes, independent of their durations.
 
         Args:
-            track: the Track into which we insert rests
-            ppqn:
+            note_rows: note rows (see bulk.NOTE_COLUMNS) of the track
+            time_sig_bottom: denominator of the track's time signature
+
+        Returns:
+            list: rest rows (see bulk.NOTE_COLUMNS)
         """
-        # find total number of durks in track
-        firstNote = self.session.query(Note).filter(Note.track == track).order_by(Note.start.asc()).first()
-        lastNote = self.session.query(Note).filter(Note.track == track).order_by(Note.end.desc()).first()
+        # if no notes in track, there are no rests
+        if not note_rows:
+            return []
 
-        # if no notes in track, just return
-        if firstNote is None or lastNote is None:
-            return
+        intervals = sorted((row[_START], row[_END]) for row in note_rows)
+        max_durk = max(end for start,end in intervals)
 
-        max_durk = lastNote.end
-        min_durk = firstNote.start
-
-        # initialize rest list (each entry represents one durk)
-        rest_list = [True for i in range(max_durk+1)]
-
-        # change all durks in rest_list to 0 where note is being played
-        for idx, note in enumerate(track.notes):
-            # try:
-            # if idx == len(track.notes) - 1:
-            #     pdb.set_trace()
-            for durk in range(note.dur):
-                try:
-                    rest_list[note.start + durk] = False  # set rest_list to False for each durk where a note pitch is playing
-                except:
-                    pdb.set_trace()
-        # iterate through completed rest_list and insert appropriate rests into track
-        current_durk = min_durk
-        while current_durk < max_durk:
-            if rest_list[current_durk]:  # rest found!
-                rest_start = current_durk  # store start of rest note
-
-                while current_durk < max_durk and rest_list[current_durk]:  # increment current_durk until pitch found
-                    current_durk += 1
-
-                rest_dur = current_durk - rest_start
-                rest_measure = rest_start / (DURKS_PER_QUARTER_NOTE * track.time_sig_bottom)  # note 8 is number of durks per quarter note
-
-                note = Note(pitch=-1, dur=rest_dur, start=rest_start, end=rest_dur+rest_start,
-                            tick_dur=-1, start_tick=-1, measure=rest_measure, track=track)
-                self.session.add(note)
-            else:
-                current_durk += 1
+        rests = []
+        covered = intervals[0][0]  # every durk before `covered` is either played or before the first note
+        for start,end in intervals + [(max_durk, max_durk + 1)]:  # sentinel closes a gap before a zero-length note
+            if end <= start:  # zero-length notes don't hold a pitch
+                continue
 
-        return
+            if start > covered:  # rest found!
+                rest_measure = covered / (DURKS_PER_QUARTER_NOTE * time_sig_bottom)  # note 8 is number of durks per quarter note
+                rests.append((-1, None, start - covered, covered, start, -1, -1, rest_measure))
 
+            covered = max(covered, end)
+
+        return rests
 
     def is_instr_track(self,track):
         """
@@ -269,7 +325,6 @@ class Runner(Process):
         else:
             return None
 
-
     def get_notes(self,note_events, ppqn, track):
         """
         Given a list of note events (from function get_note_events), and ppqn (pulses per quarter note)
@@ -286,7 +341,27 @@ class Runner(Process):
         Returns:
             Note[]: list of note objects with appropriate durations and other properties
         """
-        note_objs = []
+        return [Note(track=track, **dict(zip(NOTE_COLUMNS,row)))
+                for row in self.pair_note_events(note_events, ppqn, track.time_sig_bottom, track.instr_name)]
+
+    def pair_note_events(self,note_events, ppqn, time_sig_bottom, instr_name):
+        """
+        Given a list of note events (from function get_note_events), and ppqn (pulses per quarter note)
+           returns list of note rows with appropriate durations and other properties
+
+        Notes:
+            this method calculates appropriate durations based on ppqn of track
+
+        Args:
+            note_events: the note events
+            ppqn: pulses per quarter notes
+            time_sig_bottom: denominator of the time signature, used to compute measures
+            instr_name: name of the instrument (for warnings)
+
+        Returns:
+            list: note rows (see bulk.NOTE_COLUMNS) with appropriate durations and other properties
+        """
+        note_rows = []
         unclosed_notes = defaultdict(lambda: [])  # holds running hash of notes that haven't seen an off event yet
                                                   # key is note pitch (integer from 0-127), value is a QUEUE of note_event tuples
         for note_event in note_events:
@@ -297,8 +372,8 @@ class Runner(Process):
                 unclosed_notes[pitch].append(note_event)
             elif on_off == 0:  # NoteOffEvent
                 if len(unclosed_notes[pitch]) == 0:
-                    measure = note_event[1] / (ppqn * track.time_sig_bottom)
-                    print 'Warning: <get_notes> NoteOffEvent without corresponding NoteOnEvent %r, measure: %r, instr: %r, pitch: %r ' % (str(note_event), str(measure), track.instr_name, str(pitch))
+                    measure = note_event[1] / (ppqn * time_sig_bottom)
+                    print 'Warning: <get_notes> NoteOffEvent without corresponding NoteOnEvent %r, measure: %r, instr: %r, pitch: %r ' % (str(note_event), str(measure), instr_name, str(pitch))
                 else:
                     note_on = unclosed_notes[pitch].pop(0)
                     start_tick = note_on[1]
@@ -309,18 +384,14 @@ class Runner(Process):
                     dur = .25 * tick_dur / ppqn  # 1 === whole note, .25 === quarter note
                     dur = int(round(dur * 32))  # final conversion to durk units: 1 === a 32nd note....32  === a whole note
 
-                    measure = start_tick / (ppqn * track.time_sig_bottom)
+                    measure = start_tick / (ppqn * time_sig_bottom)
 
-                    note_obj = Note(pitch=pitch, dur=dur, start=start, end=dur+start,
-                                    tick_dur=tick_dur, start_tick=start_tick, measure=measure, track=track,
-                                    iso_pitch=midi2str(pitch))
-                    note_objs.append(note_obj)
+                    note_rows.append((pitch, midi2str(pitch), dur, start, dur+start, tick_dur, start_tick, measure))
 
             else:  # Error checking
                 print 'Warning: <get_notes> Note is neither On nor Off event'
 
-        return note_objs
-
+        return note_rows
 
     def get_note_events(self,track):
         """
@@ -344,4 +415,152 @@ class Runner(Process):
                 note = (0, event.tick, event.data[0], event.data[1])
                 notes.append(note)
 
-        return notes
\ No newline at end of file
+        return notes
+
+
+class Runner(MidiParser,Process):
+    """
+    A database worker process. Parses MIDI files pulled from self.q and stores them in database self.shard.
+    """
+
+    def __init__(self,q,engines,counter,bulk=False,row_counter=None,shard=0,fast=False):
+        """
+        Initialize a Runner
+        Args:
+            q: the queue of MIDI files, as (path, size, mtime, hash) (see manifest.ManifestIndex.pending)
+            engines (EngineRegistry): the database engines. The engine is created once the process is running.
+            counter: count the number of songs that have been parsed.
+            bulk: if True, store songs with bulk inserts (see bulk.py) rather than through the ORM
+            row_counter: count the number of rows that have been written (optional)
+            shard: index of the database into which we store the Notes, recorded in the manifest
+            fast: if True, read files with the streaming NumPy reader (see smf.py)
+        """
+        Process.__init__(self)
+        MidiParser.__init__(self,fast)
+        self.q = q
+        self.engines = engines
+        self.shard = shard
+        self.counter = counter
+        self.row_counter = row_counter
+        self.bulk = bulk
+
+        # number of rows written for the song currently being stored
+        self.rows_written = 0
+
+    def connect(self):
+        """
+        Create the session and bulk writer of this process
+        """
+        engine = self.engines[self.shard]
+        Session = sessionmaker(bind=engine)
+        self.session = Session()
+        self.writer = BulkWriter(engine)
+
+    def run(self):
+        """
+        Start the process. A None on the queue tells the process to stop.
+        """
+        self.connect()
+        while True:
+            info = self.q.get()
+            if info is None:
+                break
+            midiPath = info[0]
+
+            count = self.counter.incrementAndGet()
+            print str(count) + ". Analyzing " + midiPath.split('/')[-1]
+
+            start = time.time()
+            self.rows_written = 0
+            if self.bulk:
+                self.midi_to_song_bulk(midiPath,info)
+            else:
+                self.midi_to_song(midiPath,info)
+            elapsed = time.time() - start
+
+            if self.row_counter:
+                self.row_counter.addAndGet(self.rows_written)
+            print "Finished %s (%d rows, %.0f rows/sec)" % (midiPath.split('/')[-1], self.rows_written,
+                                                          self.rows_written / max(elapsed,1e-6))
+
+    def midi_to_song_bulk(self,midifilename,info=None):
+        """
+        Takes midi file and stores it with bulk inserts (see bulk.BulkWriter), rather than through the ORM.
+
+        Args:
+            midifilename: filename of the MIDI file to parse and store in the database
+            info: (path, size, mtime, hash) of the file. If given, the outcome is recorded in the manifest.
+
+        Returns:
+            int: number of rows written
+        """
+        try:
+            title,resolution,tracks = self.midi_to_rows(midifilename)
+        except UnreadableMidiFile as e:
+            print 'Exception: ' + str(e)
+            if info:
+                self.writer.write_failure(manifest_values(info,FAILED,self.shard,str(e)))
+            return 0
+
+        manifest = (manifest_values(info,STORED,self.shard) if info else None)
+        self.rows_written = self.writer.write(title,resolution,tracks,manifest)
+        return self.rows_written
+
+    def midi_to_song(self,midifilename,info=None):
+        """
+        Takes midi file and returns a representative song object
+
+        - a Song is a list of many Tracks
+        - a Track is a list of many Notes representing a common 1) key signature, 2) time signature, and 3) instrument key
+
+        Args:
+            midifilename: filename of the MIDI file to parse and store in the database
+            info: (path, size, mtime, hash) of the file. If given, the outcome is recorded in the manifest.
+        """
+        try:
+            title,resolution,tracks = self.midi_to_rows(midifilename,rests=False)
+        except UnreadableMidiFile as e:
+            print 'Exception: ' + str(e)
+            if info:
+                self.session.add(Manifest(**manifest_values(info,FAILED,self.shard,str(e))))
+                self.session.commit()
+            return
+
+        # create Song object
+        song = Song(title=title, ppqn=resolution)
+        self.session.add(song)
+        self.rows_written += 1
+
+        # create appropriate song, track, and note structure
+        for track_row,note_rows in tracks:
+            track = Track(song=song, **dict(zip(TRACK_COLUMNS,track_row)))
+            self.session.add(track)
+            self.rows_written += 1
+
+            for row in note_rows:
+                n = Note(track=track, **dict(zip(NOTE_COLUMNS,row)))
+                self.session.add(n)
+                self.rows_written += 1
+
+            self.insert_rests_into_track(track, note_rows)  # insert rests into track
+
+        # record the song in the manifest, in the same transaction
+        if info:
+            self.session.add(Manifest(song=song, **manifest_values(info,STORED,self.shard)))
+        self.session.commit()
+        return song
+
+    def insert_rests_into_track(self,track,note_rows):
+        """
+        Take a Track object, inserts rest into the appropriate locations (where no pitch is being played)
+
+        Warnings:
+            Directly modifies the Track object that is passed to it!
+
+        Args:
+            track: the Track into which we insert rests
+            note_rows: note rows (see bulk.NOTE_COLUMNS) of the track, used instead of querying the database
+        """
+        for row in self.get_rests(note_rows, track.time_sig_bottom):
+            self.session.add(Note(track=track, **dict(zip(NOTE_COLUMNS,row))))
+            self.rows_written += 1
@@ -0,0 +1,130 @@
+import os,hashlib
+
+from sqlalchemy import Column, String, Integer, Float, ForeignKey
+from sqlalchemy.orm import relationship
+from . import Base
+
+STORED = 'stored'
+"""str: the file was parsed and stored as a Song"""
+
+FAILED = 'failed'
+"""str: the file could not be parsed. It is quarantined, and will not be retried."""
+
+class Manifest(Base):
+    """
+    A Manifest entry records the outcome of ingesting one MIDI file, so that re-runs of midi_store skip it.
+    It is written in the same transaction as the Song it produced.
+    """
+    __tablename__ = 'manifest'
+
+    hash = Column(String(length=40), primary_key=True)
+    """str: SHA-1 of the file contents"""
+
+    path = Column(String, nullable=False)
+    """str: absolute path of the file when it was ingested"""
+
+    size = Column(Integer, nullable=False)
+    """int: size of the file in bytes"""
+
+    mtime = Column(Float, nullable=False)
+    """float: modification time of the file"""
+
+    status = Column(String(length=8), nullable=False)
+    """str: STORED or FAILED"""
+
+    reason = Column(String, nullable=True)
+    """str: why the file could not be parsed (FAILED only)"""
+
+    shard = Column(Integer, nullable=True)
+    """int: the artist_N database the file was sent to"""
+
+    song_id = Column(Integer, ForeignKey('song.id'), nullable=True)
+    """int: id of the Song stored from this file (STORED only)"""
+
+    song = relationship("Song")
+    """Song: the Song stored from this file (STORED only)"""
+
+    def __repr__(self):
+        return "Manifest(hash=%r, path=%r, status=%r, reason=%r, shard=%r, song_id=%r)" % \
+            (self.hash, self.path, self.status, self.reason, self.shard, self.song_id)
+
+def content_hash(path):
+    """
+    Compute the SHA-1 of a file's contents
+
+    Args:
+        path: the file to hash
+
+    Returns:
+        str: the hex digest
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def manifest_values(info, status, shard, reason=None):
+    """
+    Build the column values of a Manifest entry
+
+    Args:
+        info: (path, size, mtime, hash) of the file (see ManifestIndex.pending)
+        status: STORED or FAILED
+        shard: index of the database the file was sent to
+        reason: why the file failed, if it did
+
+    Returns:
+        dict: the column values (without song_id)
+    """
+    path, size, mtime, digest = info
+    return dict(hash=digest, path=path, size=size, mtime=mtime, status=status, reason=reason, shard=shard)
+
+class ManifestIndex(object):
+    """
+    Everything that has already been ingested into any of the databases.
+    """
+    def __init__(self, sessions):
+        """
+        Load the manifests of all databases
+
+        Args:
+            sessions: the database sessions
+        """
+        self.stats = {}  # path => (size, mtime)
+        self.hashes = set()
+
+        for session in sessions:
+            for digest, path, size, mtime in session.query(Manifest.hash, Manifest.path, Manifest.size, Manifest.mtime):
+                self.stats[path] = (size, mtime)
+                self.hashes.add(digest)
+
+    def pending(self, paths):
+        """
+        Determine which files still need to be ingested.
+
+        Files whose path, size and mtime match a manifest entry are skipped without being read.
+        The remaining files are hashed, and skipped if their contents were already ingested (or quarantined).
+
+        Args:
+            paths: absolute paths of the candidate MIDI files
+
+        Returns:
+            list: (path, size, mtime, hash) of every file to ingest
+        """
+        res = []
+        seen = set()
+        for path in paths:
+            st = os.stat(path)
+            if self.stats.get(path) == (st.st_size, st.st_mtime):
+                continue
+
+            digest = content_hash(path)
+            if digest in self.hashes or digest in seen:
+                continue
+
+            seen.add(digest)
+            res.append((path, st.st_size, st.st_mtime, digest))
+
+        print "Skipping", len(paths) - len(res), "of", len(paths), "files (already ingested)."
+        return res
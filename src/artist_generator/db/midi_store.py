@@ -3,20 +3,34 @@
 '''
 Stores midi files in a directory into DB
 
-python -m db.midi_store [-d data_directory] [-t pool_size] [-u username] [-p password]
+python -m db.midi_store [-d data_directory] [-t pool_size] [-u username] [-p password] [-b]
+                         [-P parse_workers] [-w writers_per_db] [-q queue_size] [-f]
 
 where:
     - `data_directory` is the location of the MIDI files.
     - `pool_size` is the number of databases
     - `username` is the database username
     - `password` is the database password
+    - `-b` stores songs with bulk inserts (COPY on PostgreSQL) instead of through the ORM
+    - `parse_workers`, if given, runs the two-stage pipeline (see pipeline.py) with that many parse processes
+    - `writers_per_db` is the number of pipeline writer processes per database
+    - `queue_size` is the maximum number of parsed songs waiting for the pipeline writers
+    - `-f` reads files with the streaming NumPy reader (see smf.py) instead of python-midi
+
+Every file is sent to the database chosen by its content hash (see shard.py), and recorded in that database's
+manifest (see manifest.py), so re-runs only ingest new files. Files that failed to parse are quarantined and
+not retried.
 '''
 
-import os,fnmatch
+import os,fnmatch,time
 from helpers import Runner
+from pipeline import run_pipeline
 from optparse import OptionParser
 from multiprocessing import Queue
-from . import get_engines
+from . import EngineRegistry,Manifest
+from engines import check_budget
+from manifest import ManifestIndex
+from shard import ShardRouter
 from utils import Counter
 
 def main():
@@ -30,22 +44,57 @@ def main():
     parser.add_option("-t", "--pool-size", dest="pool_size", default=8, type="int")
     parser.add_option("-u", "--username", dest="db_username", default="postgres")
     parser.add_option("-p", "--password", dest="db_password", default="postgres")
+    parser.add_option("-b", "--bulk", dest="bulk", action="store_true", default=False,
+                      help="store songs with bulk inserts rather than through the ORM")
+    parser.add_option("-P", "--parse-workers", dest="parse_workers", default=0, type="int",
+                      help="run separate parse / write stages with this many parse processes (always bulk)")
+    parser.add_option("-w", "--writers-per-db", dest="writers_per_db", default=1, type="int")
+    parser.add_option("-q", "--queue-size", dest="queue_size", default=64, type="int")
+    parser.add_option("-f", "--fast-parser", dest="fast", action="store_true", default=False,
+                      help="read files with the streaming NumPy reader rather than python-midi")
 
     (options, args) = parser.parse_args()
 
-    # construct the mp.Queue of midi files to process
-    q = Queue()
+    # find all the midi files to process
+    paths = []
     for root, dirnames, filenames in os.walk(options.data_directory):
         for filename in fnmatch.filter(filenames, '*.mid'):
-            midiPath = os.path.abspath(os.path.join(root, filename))
-            q.put(midiPath)
+            paths.append(os.path.abspath(os.path.join(root, filename)))
+
+    # the database engines. Every worker process creates its own, sized for one connection at a time
+    engines = EngineRegistry(options.pool_size,options.db_username,options.db_password)
+    check_budget(engines,options.writers_per_db if options.parse_workers > 0 else 1)
+
+    # skip the files that have already been ingested
+    for engine in engines:
+        Manifest.__table__.create(engine,checkfirst=True)
+    index = ManifestIndex([engines.session(i) for i in xrange(options.pool_size)])
+    infos = index.pending(paths)
+
+    # place every file on its database
+    router = ShardRouter(options.pool_size)
+    routed = [(info,router.route(info[3])) for info in infos]
+
+    if options.parse_workers > 0:
+        run_pipeline(routed,engines,options.parse_workers,options.writers_per_db,options.queue_size,fast=options.fast)
+        print engines.report()
+        return
+
+    # construct the mp.Queues of midi files to process, one per database
+    queues = [Queue() for i in xrange(options.pool_size)]
+    for info,shard in routed:
+        queues[shard].put(info)
+
+    # one stop signal per worker
+    for q in queues:
+        q.put(None)
 
-    # construct the series of database engines
-    engines = get_engines(options.pool_size,options.db_username,options.db_password)
     processes = []
     counter = Counter(0)
+    row_counter = Counter(0)
+    start = time.time()
     for i in xrange(options.pool_size):
-        p = Runner(q,engines[i],counter)
+        p = Runner(queues[i],engines,counter,options.bulk,row_counter,i,options.fast)
         p.start()
         processes.append(p)
 
@@ -53,6 +102,12 @@ def main():
     for p in processes:
         p.join()
 
+    elapsed = time.time() - start
+    print "Stored %d songs, %d rows in %.1fs (%.0f rows/sec, %s)" % (counter.value(), row_counter.value(), elapsed,
+                                                                    row_counter.value() / max(elapsed,1e-6),
+                                                                    "bulk" if options.bulk else "orm")
+    print engines.report()
+
 if __name__ == "__main__":
     main()
     pass
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+Bring the schema of existing artist_N databases up to date with the model definitions.
+
+    $ python -m db.migrate [-t DBPOOL_SIZE] [-u USERNAME] [-p PASSWORD] [-s SAMPLES] [-n]
+
+where:
+    - DBPOOL_SIZE is the number of databases
+    - USERNAME is the database username
+    - PASSWORD is the database password
+    - SAMPLES is the number of sample queries used for the latency report (default 50)
+    - `-n` only reports what is missing
+
+reset.create only builds the schema of brand new databases. This script creates the tables (e.g. the manifest)
+and indexes declared on the models that an existing database is missing, then runs ANALYZE so the planner
+picks them up. The indexes serve the hot query paths:
+
+- `ix_note_track_id_start`: Track.notes loads, ordered by start,
+- `ix_track_song_id`: Song.tracks loads, and
+- `ix_song_unanalyzed`: a partial index on songs with analyzed IS NOT TRUE.
+
+The latency of those queries is measured before and after the migration.
+"""
+
+import time,random
+from optparse import OptionParser
+from sqlalchemy import inspect, select, text
+
+from . import get_engines,Base,Song,Track,Note
+
+def missing_tables(engine):
+    """
+    Find the tables declared on the models that do not exist in a database
+
+    Args:
+        engine: the database engine
+
+    Returns:
+        Table[]: the missing tables
+    """
+    tables = set(inspect(engine).get_table_names())
+    return [table for table in Base.metadata.sorted_tables if table.name not in tables]
+
+def missing_indexes(engine):
+    """
+    Find the indexes declared on the models that do not exist in a database
+
+    Args:
+        engine: the database engine
+
+    Returns:
+        Index[]: the missing indexes
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+
+    res = []
+    for table in Base.metadata.sorted_tables:
+        existing = (set(ix['name'] for ix in inspector.get_indexes(table.name)) if table.name in tables else set())
+        for index in table.indexes:
+            if index.name not in existing:
+                res.append(index)
+    return res
+
+def migrate(engine):
+    """
+    Create the missing tables and indexes of a database
+
+    Args:
+        engine: the database engine
+
+    Returns:
+        str[]: the names of the created indexes
+    """
+    indexes = missing_indexes(engine)
+    tables = set(inspect(engine).get_table_names())
+
+    # create_all creates missing tables along with their indexes
+    Base.metadata.create_all(engine)
+
+    created = []
+    for index in indexes:
+        if index.table.name in tables:
+            index.create(engine)
+        created.append(index.name)
+
+    if engine.dialect.name == 'postgresql':
+        engine.execute(text("ANALYZE"))
+    return created
+
+def sample(engine,samples):
+    """
+    Pick random songs and tracks to time queries with
+
+    Args:
+        engine: the database engine
+        samples: number of songs / tracks to sample
+
+    Returns:
+        tuple: (song ids, track ids)
+    """
+    song_ids = [row[0] for row in engine.execute(select([Song.__table__.c.id]))]
+    track_ids = [row[0] for row in engine.execute(select([Track.__table__.c.id]))]
+    return random.sample(song_ids,min(samples,len(song_ids))),random.sample(track_ids,min(samples,len(track_ids)))
+
+def latency(engine,song_ids,track_ids):
+    """
+    Time the hot queries
+
+    Args:
+        engine: the database engine
+        song_ids: the songs whose tracks to load
+        track_ids: the tracks whose notes to load
+
+    Returns:
+        dict: query name => mean latency in milliseconds
+    """
+    song_t,track_t,note_t = Song.__table__,Track.__table__,Note.__table__
+
+    queries = {
+        'Track.notes': [select([note_t]).where(note_t.c.track_id == i).order_by(note_t.c.start) for i in track_ids],
+        'Song.tracks': [select([track_t]).where(track_t.c.song_id == i) for i in song_ids],
+        'unanalyzed songs': [select([song_t.c.id]).where(song_t.c.analyzed.isnot(True)).limit(100)],
+    }
+
+    res = {}
+    for name,qs in queries.iteritems():
+        start = time.time()
+        for q in qs:
+            engine.execute(q).fetchall()
+        res[name] = 1000 * (time.time() - start) / max(len(qs),1)
+    return res
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option("-t", "--pool-size", dest="pool_size", default=8, type="int")
+    parser.add_option("-u", "--username", dest="db_username", default="postgres")
+    parser.add_option("-p", "--password", dest="db_password", default="postgres")
+    parser.add_option("-s", "--samples", dest="samples", default=50, type="int")
+    parser.add_option("-n", "--dry-run", dest="dry_run", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    for i,engine in enumerate(get_engines(options.pool_size,options.db_username,options.db_password)):
+        missing = ["table " + table.name for table in missing_tables(engine)] + \
+                  [index.name for index in missing_indexes(engine)]
+        print "artist_%d: missing %s" % (i, ", ".join(missing) if missing else "nothing")
+        if options.dry_run or not missing:
+            continue
+
+        song_ids,track_ids = sample(engine,options.samples)
+        before = latency(engine,song_ids,track_ids)
+        migrate(engine)
+        after = latency(engine,song_ids,track_ids)
+
+        for name in sorted(before):
+            print "\t%-18s %8.2f ms -> %8.2f ms" % (name, before[name], after[name])
+
+if __name__ == '__main__':
+    main()
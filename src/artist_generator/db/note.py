@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, String
+from sqlalchemy import Column, Integer, ForeignKey, String, Index
 from sqlalchemy.orm import relationship
 from . import Base
 
@@ -9,6 +9,9 @@ class Note(Base):
 
     __tablename__ = 'note'
 
+    # Track.notes loads, ordered by start (see migrate.py)
+    __table_args__ = (Index('ix_note_track_id_start', 'track_id', 'start'),)
+
     id = Column(Integer, primary_key=True)
     """int: primary key"""
 
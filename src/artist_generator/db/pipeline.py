@@ -0,0 +1,166 @@
+"""
+A two-stage ingest pipeline.
+
+- Parser processes turn MIDI files into compact song batches (plain tuples, see helpers.MidiParser.midi_to_rows).
+  This stage is CPU-bound.
+- Writer processes (one or more per database) store the batches with bulk inserts (see bulk.BulkWriter),
+  and record the outcome of every file in the manifest. This stage is I/O-bound.
+
+The stages are connected by one bounded queue per database, so parsers block when the writers fall behind
+(backpressure). Every file goes to the database chosen by its content hash (see shard.ShardRouter).
+Each stage keeps Throughput counters; the stage that is busy nearly 100% of the time is the bottleneck.
+"""
+
+import sys,time
+from multiprocessing import Process,Queue
+
+from helpers import MidiParser
+from bulk import BulkWriter
+from manifest import STORED,FAILED,manifest_values
+from exceptions import UnreadableMidiFile
+from utils import Throughput
+
+class Parser(MidiParser,Process):
+    """
+    A parse worker process. Parses MIDI files pulled from self.files and puts the song batches on the queue of
+    their database.
+    """
+    def __init__(self,files,batches,stats,fast=False):
+        """
+        Initialize a Parser
+
+        Args:
+            files: the queue of (info, shard), where info is (path, size, mtime, hash) (None tells the process to stop)
+            batches: the bounded queues of (info, parsed song, failure reason), one per database
+            stats (Throughput): the parse stage counters
+            fast: if True, read files with the streaming NumPy reader (see smf.py)
+        """
+        Process.__init__(self)
+        MidiParser.__init__(self,fast)
+        self.files = files
+        self.batches = batches
+        self.stats = stats
+
+    def run(self):
+        """
+        Start the process
+        """
+        while True:
+            item = self.files.get()
+            if item is None:
+                break
+            info,shard = item
+
+            start = time.time()
+            try:
+                parsed = self.midi_to_rows(info[0])
+            except UnreadableMidiFile as e:
+                print 'Exception: ' + str(e)
+                self.batches[shard].put((info,None,str(e)))
+                self.stats.record(busy=time.time() - start)
+                continue
+            parsed_at = time.time()
+
+            # blocks while the queue is full
+            self.batches[shard].put((info,parsed,None))
+
+            rows = 1 + sum(len(note_rows) + 1 for track_row,note_rows in parsed[2])
+            self.stats.record(items=1,rows=rows,busy=parsed_at - start,waiting=time.time() - parsed_at)
+
+class Writer(Process):
+    """
+    A database writer process. Stores song batches pulled from self.batches in database self.shard.
+    """
+    def __init__(self,batches,engines,stats,shard=0):
+        """
+        Initialize a Writer
+
+        Args:
+            batches: the bounded queue of (info, parsed song, failure reason) for this database (None tells the process to stop)
+            engines (EngineRegistry): the database engines. The engine is created once the process is running.
+            stats (Throughput): the write stage counters
+            shard: index of the database into which we store the songs, recorded in the manifest
+        """
+        Process.__init__(self)
+        self.batches = batches
+        self.engines = engines
+        self.shard = shard
+        self.stats = stats
+
+    def run(self):
+        """
+        Start the process
+        """
+        self.writer = BulkWriter(self.engines[self.shard])
+        while True:
+            start = time.time()
+            batch = self.batches.get()
+            got_at = time.time()
+
+            if batch is None:
+                break
+
+            info,parsed,reason = batch
+            try:
+                if parsed is None:
+                    self.writer.write_failure(manifest_values(info,FAILED,self.shard,reason))
+                    rows = 0
+                else:
+                    title,ppqn,tracks = parsed
+                    rows = self.writer.write(title,ppqn,tracks,manifest_values(info,STORED,self.shard))
+            except Exception as e:
+                sys.stderr.write("Exception when storing " + info[0] + ":\n")
+                sys.stderr.write("\t" + str(e) + "\n")
+                rows = 0
+
+            self.stats.record(items=1,rows=rows,busy=time.time() - got_at,waiting=got_at - start)
+
+def run_pipeline(routed,engines,num_parsers,writers_per_db=1,queue_size=64,report_interval=10,fast=False):
+    """
+    Parse and store the MIDI files in routed, printing per-stage throughput along the way.
+
+    Args:
+        routed: the MIDI files, as (info, shard) (see midi_store.main)
+        engines (EngineRegistry): the database engines to store into
+        num_parsers: number of parse processes
+        writers_per_db: number of writer processes per database
+        queue_size: maximum number of parsed songs waiting to be written to each database
+        report_interval: seconds between throughput reports
+        fast: if True, parsers read files with the streaming NumPy reader (see smf.py)
+    """
+    files = Queue()
+    for item in routed:
+        files.put(item)
+    for i in xrange(num_parsers):
+        files.put(None)
+
+    batches = [Queue(maxsize=queue_size) for i in xrange(len(engines))]
+    parse_stats = Throughput("parse")
+    write_stats = Throughput("write")
+
+    parsers = [Parser(files,batches,parse_stats,fast) for i in xrange(num_parsers)]
+    writers = [Writer(batches[shard],engines,write_stats,shard)
+               for shard in xrange(len(engines)) for i in xrange(writers_per_db)]
+
+    start = time.time()
+    for p in parsers + writers:
+        p.start()
+
+    def report():
+        elapsed = time.time() - start
+        print parse_stats.report(elapsed)
+        print write_stats.report(elapsed)
+
+    # wait for the parsers, reporting as we go
+    for p in parsers:
+        while p.is_alive():
+            p.join(report_interval)
+            report()
+
+    # then drain the queues
+    for w in writers:
+        w.batches.put(None)
+    for w in writers:
+        w.join()
+
+    report()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Move songs between the artist_N databases until they hold similar numbers of notes.
+
+    $ python -m db.rebalance [-t DBPOOL_SIZE] [-u USERNAME] [-p PASSWORD] [-l TOLERANCE] [-n]
+
+where:
+    - DBPOOL_SIZE is the number of databases
+    - USERNAME is the database username
+    - PASSWORD is the database password
+    - TOLERANCE is the allowed deviation from the mean note count, as a fraction (default 0.05)
+    - `-n` only prints the planned moves
+
+A moved song is copied (with its tracks, notes, analysis and manifest entry) before it is deleted from its
+source database, so an interruption can at worst leave a duplicate behind. The manifest entry moves along
+with the song and records its new database. As midi_store skips every file found in a manifest (see
+manifest.ManifestIndex), the moved song is never routed (see shard.py) or stored again.
+"""
+
+from optparse import OptionParser
+from sqlalchemy import func, select
+
+from . import get_engines,Song,Track,Note,Manifest
+
+def song_sizes(engine):
+    """
+    Count the notes of every song in a database
+
+    Args:
+        engine: the database engine
+
+    Returns:
+        dict: song id => number of notes
+    """
+    query = select([Track.__table__.c.song_id, func.count(Note.__table__.c.id)]) \
+        .select_from(Track.__table__.join(Note.__table__)) \
+        .group_by(Track.__table__.c.song_id)
+    return dict((song_id, count) for song_id,count in engine.execute(query))
+
+def plan(sizes,tolerance):
+    """
+    Greedily plan song moves from the fullest to the emptiest database.
+
+    Args:
+        sizes: per database, a dict of song id => number of notes (see song_sizes)
+        tolerance: allowed deviation from the mean note count, as a fraction
+
+    Returns:
+        list: (song id, source database, destination database) moves
+    """
+    totals = [sum(s.itervalues()) for s in sizes]
+    mean = sum(totals) / float(len(totals))
+    slack = tolerance * mean
+
+    # songs of each database, smallest first
+    songs = [sorted(s.iteritems(), key=lambda item: item[1]) for s in sizes]
+
+    moves = []
+    while True:
+        src = max(xrange(len(totals)), key=lambda i: totals[i])
+        dst = min(xrange(len(totals)), key=lambda i: totals[i])
+        if totals[src] - mean <= slack and mean - totals[dst] <= slack:
+            break
+
+        # the largest song that does not overshoot the middle
+        gap = (totals[src] - totals[dst]) / 2
+        candidates = [i for i,(song_id,count) in enumerate(songs[src]) if 0 < count <= gap]
+        if not candidates:
+            break
+
+        song_id,count = songs[src].pop(candidates[-1])
+        totals[src] -= count
+        totals[dst] += count
+        moves.append((song_id, src, dst))
+
+    return moves
+
+def _copy(src,dst,table,where,replace):
+    """
+    Copy the rows of table matching where from src to dst, with new primary keys.
+
+    Args:
+        src: the source connection
+        dst: the destination connection
+        table: the Table to copy
+        where: the clause selecting the rows
+        replace: column name => value overrides (e.g. the new foreign key)
+
+    Returns:
+        list: (old id, new id) of every copied row
+    """
+    ids = []
+    for row in src.execute(table.select().where(where)):
+        values = dict((col.name, row[col.name]) for col in table.columns if col.name != 'id')
+        values.update(replace)
+        ids.append((row['id'], dst.execute(table.insert().values(**values)).inserted_primary_key[0]))
+    return ids
+
+def _copy_manifest(src,dst,song_id,new_song_id,dst_shard):
+    """
+    Copy the manifest entries of a song, keeping their hash (the primary key)
+
+    Args:
+        src: the source connection
+        dst: the destination connection
+        song_id: id of the song in the source database
+        new_song_id: id of the song in the destination database
+        dst_shard: index of the destination database
+
+    Returns:
+        int: number of entries copied
+    """
+    manifest_t = Manifest.__table__
+    rows = [dict((col.name, row[col.name]) for col in manifest_t.columns)
+            for row in src.execute(manifest_t.select().where(manifest_t.c.song_id == song_id))]
+    for values in rows:
+        values.update(song_id=new_song_id, shard=dst_shard)
+        dst.execute(manifest_t.insert().values(**values))
+    return len(rows)
+
+def move_song(song_id,src_engine,dst_engine,dst_shard):
+    """
+    Move a song, with its tracks, notes and manifest entry, to another database.
+
+    Args:
+        song_id: id of the song in the source database
+        src_engine: the source database engine
+        dst_engine: the destination database engine
+        dst_shard: index of the destination database, recorded in the manifest
+    """
+    song_t,track_t,note_t,manifest_t = Song.__table__,Track.__table__,Note.__table__,Manifest.__table__
+
+    src = src_engine.connect()
+    dst = dst_engine.connect()
+    try:
+        # copy ...
+        trans = dst.begin()
+        try:
+            [(old_id,new_song_id)] = _copy(src,dst,song_t,song_t.c.id == song_id,{})
+            for old_track_id,new_track_id in _copy(src,dst,track_t,track_t.c.song_id == song_id,{'song_id': new_song_id}):
+                notes = [dict((col.name, row[col.name]) for col in note_t.columns if col.name != 'id')
+                         for row in src.execute(note_t.select().where(note_t.c.track_id == old_track_id))]
+                for values in notes:
+                    values['track_id'] = new_track_id
+                if notes:
+                    dst.execute(note_t.insert(), notes)
+            _copy_manifest(src,dst,song_id,new_song_id,dst_shard)
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+
+        # ... then delete
+        trans = src.begin()
+        try:
+            track_ids = select([track_t.c.id]).where(track_t.c.song_id == song_id)
+            src.execute(manifest_t.delete().where(manifest_t.c.song_id == song_id))
+            src.execute(note_t.delete().where(note_t.c.track_id.in_(track_ids)))
+            src.execute(track_t.delete().where(track_t.c.song_id == song_id))
+            src.execute(song_t.delete().where(song_t.c.id == song_id))
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+    finally:
+        src.close()
+        dst.close()
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option("-t", "--pool-size", dest="pool_size", default=8, type="int")
+    parser.add_option("-u", "--username", dest="db_username", default="postgres")
+    parser.add_option("-p", "--password", dest="db_password", default="postgres")
+    parser.add_option("-l", "--tolerance", dest="tolerance", default=0.05, type="float")
+    parser.add_option("-n", "--dry-run", dest="dry_run", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    engines = get_engines(options.pool_size,options.db_username,options.db_password)
+
+    sizes = [song_sizes(engine) for engine in engines]
+    for i,s in enumerate(sizes):
+        print "artist_%d: %d songs, %d notes" % (i, len(s), sum(s.itervalues()))
+
+    moves = plan(sizes,options.tolerance)
+    print len(moves), "songs to move."
+
+    for song_id,src,dst in moves:
+        print "song %d: artist_%d -> artist_%d (%d notes)" % (song_id, src, dst, sizes[src][song_id])
+        if not options.dry_run:
+            move_song(song_id,engines[src],engines[dst],dst)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Deterministic placement of songs on the artist_N databases.
+
+Songs are placed by the content hash of their MIDI file (see manifest.content_hash) on a consistent-hash ring.
+Every database owns VIRTUAL_NODES points on the ring, so adding a database only moves the songs that fall
+between its new points and their predecessors (about 1 / num of them).
+
+Only files that are not in any manifest yet are routed: a song moved off its ring placement (see rebalance.py)
+stays where it was moved, as its file is skipped on re-runs of midi_store (see manifest.ManifestIndex).
+"""
+
+import bisect,hashlib
+
+VIRTUAL_NODES = 128
+"""int: number of points each database owns on the ring"""
+
+def _point(key):
+    """
+    Position of a key on the ring
+
+    Args:
+        key (str): the key to place
+
+    Returns:
+        int: a 32 bit position
+    """
+    return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+class ShardRouter(object):
+    """
+    Route content hashes to database indexes (as used by get_engines / get_sessions).
+    """
+    def __init__(self, num, virtual_nodes=VIRTUAL_NODES):
+        """
+        Build the ring
+
+        Args:
+            num: number of databases
+            virtual_nodes: number of points each database owns on the ring
+        """
+        self.num = num
+
+        ring = []
+        for shard in xrange(num):
+            for v in xrange(virtual_nodes):
+                ring.append((_point("artist_%d#%d" % (shard, v)), shard))
+        ring.sort()
+
+        self.points = [point for point,shard in ring]
+        self.shards = [shard for point,shard in ring]
+
+    def route(self, digest):
+        """
+        Find the database a file belongs to
+
+        Args:
+            digest (str): the hex content hash of the file
+
+        Returns:
+            int: index of the database
+        """
+        idx = bisect.bisect(self.points, _point(digest))
+        return self.shards[idx % len(self.shards)]
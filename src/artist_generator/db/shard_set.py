@@ -0,0 +1,125 @@
+"""
+Run the same query on every artist_N database at once.
+
+The work of a corpus-wide query happens in the database servers, so a ShardSet sends it to all databases
+concurrently from a thread pool and merges the results: the answer comes back in about the time of the slowest
+database rather than the sum of all of them.
+
+    shards = ShardSet(get_engines(8))
+    num_notes = shards.sum(select([func.count()]).select_from(Note.__table__))
+    longest = shards.top(select([Song.__table__.c.title, Song.__table__.c.ppqn]), 10, key=lambda row: row.ppqn)
+"""
+
+import heapq
+from multiprocessing.pool import ThreadPool
+from sqlalchemy import select, func, text
+
+class ShardSet(object):
+    """
+    Concurrent fan-out of queries (or any function of an engine) over a set of databases
+    """
+    def __init__(self, engines, threads=None):
+        """
+        Initialize a ShardSet
+
+        Args:
+            engines: the database engines (a list, or an EngineRegistry), created in the current process
+            threads: number of threads (default: one per database)
+        """
+        self.engines = list(engines)
+        self.threads = threads or len(self.engines)
+
+    def __len__(self):
+        return len(self.engines)
+
+    def map(self, fn):
+        """
+        Call fn on every database concurrently
+
+        Args:
+            fn: a function of an engine
+
+        Returns:
+            list: the result of fn for every database, in database order
+        """
+        pool = ThreadPool(self.threads)
+        try:
+            return pool.map(fn, self.engines)
+        finally:
+            pool.close()
+
+    def execute(self, query):
+        """
+        Run a query on every database concurrently
+
+        Args:
+            query: the query (a SQL expression or string)
+
+        Returns:
+            list: the result rows of every database, in database order
+        """
+        return self.map(lambda engine: engine.execute(query).fetchall())
+
+    def sum(self, query):
+        """
+        Run a query returning a single number on every database, and add up the results
+
+        Args:
+            query: the query
+
+        Returns:
+            number: the sum over all databases (NULLs count as 0)
+        """
+        return sum(self.map(lambda engine: engine.execute(query).scalar() or 0))
+
+    def concat(self, query):
+        """
+        Run a query on every database, and concatenate the rows
+
+        Args:
+            query: the query
+
+        Returns:
+            list: the rows of all databases, in database order
+        """
+        return [row for rows in self.execute(query) for row in rows]
+
+    def top(self, query, k, key):
+        """
+        Run a query on every database, and keep the k largest rows overall.
+        Adding ORDER BY ... DESC LIMIT k to the query keeps the per-database results small.
+
+        Args:
+            query: the query
+            k: number of rows to keep
+            key: function of a row to rank rows by
+
+        Returns:
+            list: the k rows with the largest keys, largest first
+        """
+        return heapq.nlargest(k, (row for rows in self.execute(query) for row in rows), key=key)
+
+    def count(self, table, estimate=False):
+        """
+        Count the rows of a table in all databases
+
+        Args:
+            table: the Table (e.g. Note.__table__)
+            estimate: if True, use the planner's row estimate (pg_class.reltuples, as of the last ANALYZE / VACUUM)
+                instead of scanning the table. Falls back to an exact count where there is no estimate.
+
+        Returns:
+            int: the number of rows
+        """
+        exact = select([func.count()]).select_from(table)
+
+        def count(engine):
+            if estimate and engine.dialect.name == 'postgresql':
+                reltuples = engine.execute(text("SELECT reltuples FROM pg_class WHERE relname = :name"),
+                                           name=table.name).scalar()
+                # -1 (or 0 on older servers) for tables that were never analyzed
+                if reltuples is not None and reltuples > 0:
+                    return int(reltuples)
+            return engine.execute(exact).scalar()
+
+        return sum(self.map(count))
@@ -0,0 +1,282 @@
+"""
+A streaming Standard MIDI File reader that decodes straight into NumPy arrays.
+
+Unlike python-midi, which builds a Python object for every event, read_smf makes a single pass over each track
+chunk and appends only what ingest needs to flat typed arrays:
+
+- note events (on/off, absolute tick, pitch, velocity, channel),
+- time / key signature tables, and
+- program changes and the track name.
+
+pair_notes then matches note-on/off events and quantises ticks to durks with vectorised operations.
+The results are identical to helpers.MidiParser.pair_note_events.
+"""
+
+import struct
+from array import array
+import numpy as np
+
+from exceptions import UnreadableMidiFile
+
+# bytes of data following each channel message type (high nibble of the status byte)
+_DATA_BYTES = {0x8: 2, 0x9: 2, 0xA: 2, 0xB: 2, 0xC: 1, 0xD: 1, 0xE: 2}
+
+META_TRACK_NAME = 0x03
+META_END_OF_TRACK = 0x2F
+META_TIME_SIGNATURE = 0x58
+META_KEY_SIGNATURE = 0x59
+
+class SmfTrack(object):
+    """
+    The events of one track chunk that matter for ingest. All ticks are absolute.
+    """
+    def __init__(self):
+        self.on_off = array('b')
+        """array: 1 for NoteOn, 0 for NoteOff (or NoteOn with velocity 0)"""
+        self.tick = array('l')
+        self.pitch = array('B')
+        self.velocity = array('B')
+        self.channel = array('B')
+
+        self.time_sigs = []
+        """list: (tick, numerator, denominator power of 2)"""
+        self.key_sigs = []
+        """list: (tick, sharps / flats as an unsigned byte, 0 major / 1 minor), as in python-midi"""
+        self.programs = []
+        """list: (tick, channel, program)"""
+        self.name = ""
+        """str: text of the last TrackNameEvent"""
+
+    def note_events(self):
+        """
+        Returns:
+            numpy.ndarray: (n, 4) array of (on/off, tick, pitch, velocity), in file order
+        """
+        if not self.tick:
+            return np.zeros((0, 4), dtype='i8')
+        return np.column_stack([np.frombuffer(a, dtype=a.typecode).astype('i8')
+                                for a in (self.on_off, self.tick, self.pitch, self.velocity)])
+
+class SmfFile(object):
+    """
+    A parsed Standard MIDI File
+    """
+    def __init__(self, resolution, tracks):
+        """
+        Args:
+            resolution: pulses per quarter note
+            tracks (SmfTrack[]): the track chunks
+        """
+        self.resolution = resolution
+        self.tracks = tracks
+
+def _read_varlen(data, pos):
+    """
+    Decode a variable-length quantity
+
+    Args:
+        data: the file contents
+        pos: offset of the quantity
+
+    Returns:
+        tuple: (value, offset after the quantity)
+    """
+    val = 0
+    while True:
+        byte = ord(data[pos])
+        pos += 1
+        val = (val << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return val, pos
+
+def _read_track(data, pos, end):
+    """
+    Decode a track chunk in a single pass
+
+    Args:
+        data: the file contents
+        pos: offset of the first event
+        end: offset of the end of the chunk
+
+    Returns:
+        SmfTrack: the decoded track
+    """
+    trk = SmfTrack()
+    tick = 0
+    status = None
+    while pos < end:
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+
+        byte = ord(data[pos])
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif status is None or status >= 0xF0:
+            raise UnreadableMidiFile("running status without a previous channel message")
+
+        if status == 0xFF:  # meta event
+            kind = ord(data[pos])
+            length, pos = _read_varlen(data, pos + 1)
+            body = data[pos:pos + length]
+            pos += length
+            status = None  # meta and sysex events cancel running status
+
+            if kind == META_TIME_SIGNATURE:
+                trk.time_sigs.append((tick, ord(body[0]), ord(body[1])))
+            elif kind == META_KEY_SIGNATURE:
+                trk.key_sigs.append((tick, ord(body[0]), ord(body[1])))
+            elif kind == META_TRACK_NAME:
+                trk.name = body
+            elif kind == META_END_OF_TRACK:
+                break
+        elif status in (0xF0, 0xF7):  # sysex
+            length, pos = _read_varlen(data, pos)
+            pos += length
+            status = None
+        else:
+            kind = status >> 4
+            channel = status & 0x0F
+            nbytes = _DATA_BYTES.get(kind)
+            if nbytes is None:
+                raise UnreadableMidiFile("unknown status byte 0x%X" % status)
+            d0 = ord(data[pos])
+            d1 = (ord(data[pos + 1]) if nbytes == 2 else 0)
+            pos += nbytes
+
+            if kind == 0x9 or kind == 0x8:
+                trk.on_off.append(1 if (kind == 0x9 and d1 != 0) else 0)
+                trk.tick.append(tick)
+                trk.pitch.append(d0)
+                trk.velocity.append(d1)
+                trk.channel.append(channel)
+            elif kind == 0xC:
+                trk.programs.append((tick, channel, d0))
+
+    return trk
+
+def read_smf(path):
+    """
+    Read a Standard MIDI File
+
+    Args:
+        path: filename of the MIDI file
+
+    Returns:
+        SmfFile: the parsed file
+
+    Raises:
+        UnreadableMidiFile: if the file is not a valid Standard MIDI File
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    try:
+        if data[:4] != 'MThd':
+            raise UnreadableMidiFile("bad header chunk")
+        length, fmt, ntracks, resolution = struct.unpack('>LHHH', data[4:14])
+        if resolution & 0x8000:
+            raise UnreadableMidiFile("SMPTE time division is not supported")
+
+        tracks = []
+        pos = 8 + length
+        while pos + 8 <= len(data):
+            kind = data[pos:pos + 4]
+            length = struct.unpack('>L', data[pos + 4:pos + 8])[0]
+            pos += 8
+            if kind == 'MTrk':
+                tracks.append(_read_track(data, pos, min(pos + length, len(data))))
+            pos += length
+    except (struct.error, IndexError, TypeError) as e:
+        raise UnreadableMidiFile("truncated or malformed file: " + str(e))
+
+    return SmfFile(resolution, tracks)
+
+def _round(vals):
+    """
+    Round half away from zero (like Python 2's round) for non-negative floats
+
+    Args:
+        vals (numpy.ndarray): the values to round
+
+    Returns:
+        numpy.ndarray: the rounded integers
+    """
+    floor = np.floor(vals)
+    return (floor + (vals - floor >= 0.5)).astype('i8')
+
+def pair_notes(events, ppqn, time_sig_bottom):
+    """
+    Match note-on/off events and quantise them to durks, with vectorised operations.
+
+    Every pitch keeps a FIFO queue of open NoteOns; a NoteOff closes the oldest one, and NoteOffs with nothing
+    open are dropped. Notes come out in the order of their NoteOffs, like helpers.MidiParser.pair_note_events.
+
+    Args:
+        events (numpy.ndarray): (n, 4) array of (on/off, tick, pitch, velocity) (see SmfTrack.note_events)
+        ppqn: pulses per quarter note
+        time_sig_bottom: denominator of the time signature, used to compute measures
+
+    Returns:
+        dict: column name => numpy.ndarray for pitch, dur, start, end, tick_dur, start_tick and measure,
+        plus 'unmatched_offs', the indexes of the dropped NoteOffs in events
+    """
+    n = len(events)
+    if n == 0:
+        events = np.zeros((0, 4), dtype='i8')
+    on, tick, pitch = events[:, 0], events[:, 1], events[:, 2]
+
+    # group the events by pitch, keeping file order within a pitch
+    order = np.lexsort((np.arange(n), pitch))
+    g_on, g_pitch = on[order], pitch[order]
+    first = np.ones(n, dtype=bool)
+    first[1:] = g_pitch[1:] != g_pitch[:-1]
+    group = np.cumsum(first) - 1
+    group_start = np.flatnonzero(first)
+
+    # open[i] = number of open NoteOns after event i, clamped at zero: S_i - min(0, min_{j<=i} S_j)
+    step = np.where(g_on == 1, 1, -1)
+    walk = np.cumsum(step)
+    base = np.concatenate(([0], walk))[group_start][group]  # walk before the group starts
+    walk = walk - base
+
+    # shift groups down so that the running minimum never crosses a group boundary
+    shift = group * (2 * n + 2)
+    lowest = np.minimum.accumulate(walk - shift) + shift
+    open_after = walk - np.minimum(lowest, 0)
+    open_before = np.concatenate(([0], open_after[:-1]))
+    open_before[first] = 0
+
+    matched_off = (g_on == 0) & (open_before > 0)
+
+    # FIFO: the k-th matched NoteOff of a pitch closes the k-th NoteOn of that pitch.
+    # ons lists the NoteOns grouped by pitch, so that NoteOn is at (NoteOns before the group) + k
+    is_on = g_on == 1
+    ons = order[is_on]
+    ons_before = np.concatenate(([0], np.cumsum(is_on)))[group_start][group]
+    offs_before = np.concatenate(([0], np.cumsum(matched_off)))[group_start][group]
+    k = np.cumsum(matched_off) - 1 - offs_before
+
+    off_idx = order[matched_off]
+    start_idx = ons[(ons_before + k)[matched_off]]
+
+    # back to NoteOff order
+    by_off = np.argsort(off_idx, kind='mergesort')
+    off_idx, start_idx = off_idx[by_off], start_idx[by_off]
+
+    start_tick = tick[start_idx]
+    tick_dur = tick[off_idx] - start_tick
+
+    start = _round(.25 * start_tick / ppqn * 32)  # durk units: 1 === a 32nd note....32  === a whole note
+    dur = _round(.25 * tick_dur / ppqn * 32)
+
+    return {
+        'pitch': pitch[off_idx],
+        'dur': dur,
+        'start': start,
+        'end': start + dur,
+        'tick_dur': tick_dur,
+        'start_tick': start_tick,
+        'measure': start_tick // (ppqn * time_sig_bottom),
+        'unmatched_offs': order[(g_on == 0) & ~matched_off],
+    }
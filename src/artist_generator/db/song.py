@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, func, Boolean
+from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, func, Boolean, Index
 from sqlalchemy.orm import relationship
 from . import Base
 
@@ -26,3 +26,6 @@ class Song(Base):
     def __repr__(self):
         return "Song(title=%r, ppqn=%r, len(tracks)=%r, analyzed=%r)" % \
             (self.title, self.ppqn, len(self.tracks), self.analyzed)
+
+# the songs still waiting for harmonic analysis (see migrate.py)
+Index('ix_song_unanalyzed', Song.id, postgresql_where=Song.analyzed.isnot(True))
@@ -0,0 +1,71 @@
+"""
+Streaming scans of a whole database.
+
+Loading a table with query.all() holds every row (and, through the session's identity map, every object touched
+while processing them) in memory, and no work starts until the last row has arrived. These generators read rows
+through a server-side cursor, BATCH_SIZE rows at a time, so work starts right away and memory stays flat.
+"""
+
+from itertools import islice
+from sqlalchemy import select
+
+BATCH_SIZE = 1000
+"""int: number of rows fetched from the server at a time"""
+
+def stream(session, query, batch_size=BATCH_SIZE):
+    """
+    Iterate through the objects of an ORM query with a server-side cursor (Query.yield_per).
+
+    Once the caller is done with a batch, and before the next one is fetched, the session is emptied
+    (expunge_all) so the objects handled so far can be garbage collected. Changes have to be flushed by then,
+    and the session must not be committed during the scan (committing closes the cursor; see stream_values
+    for that case).
+
+    Args:
+        session: the database session
+        query: the ORM query
+        batch_size: number of objects fetched at a time
+
+    Returns:
+        iterator: the objects
+    """
+    # yield_per fetches the next batch only when the current one has been consumed
+    objs = iter(query.yield_per(batch_size))
+    while True:
+        batch = list(islice(objs,batch_size))
+        if not batch:
+            break
+        for obj in batch:
+            yield obj
+        batch = None
+        session.expunge_all()
+
+def stream_values(engine, column, where=None, batch_size=BATCH_SIZE):
+    """
+    Iterate through the values of a column, in order, with a server-side cursor on a connection of its own,
+    so the caller can commit on its session while scanning.
+
+    Args:
+        engine: the database engine
+        column: the column to read (e.g. Song.id)
+        where: an optional clause selecting the rows
+        batch_size: number of rows fetched at a time
+
+    Returns:
+        iterator: the values
+    """
+    query = select([column]).order_by(column)
+    if where is not None:
+        query = query.where(where)
+
+    conn = engine.connect()
+    try:
+        res = conn.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = res.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+    finally:
+        conn.close()
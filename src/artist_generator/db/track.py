@@ -45,7 +45,7 @@ class Track(Base):
     start_tick = Column(Integer, nullable=False)
     """int: Integer representing start time of track relative to song (i.e. 0 is beginning of song)"""
 
-    song_id = Column(Integer, ForeignKey('song.id'))
+    song_id = Column(Integer, ForeignKey('song.id'), index=True)
     """int: id of the Song to which this Track belongs"""
 
     song = relationship("Song", back_populates="tracks")
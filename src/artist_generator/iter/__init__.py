@@ -1,11 +1,22 @@
 """
 The iter package contains a series of 3 iterators for traversing a piece of music:
 
-- `note_iterator.py` iterates through notes in non-decreasing time order,
+- `song_iterator.py` iterates through notes in non-decreasing time order (StreamingSongIterator does so without
+  loading the whole song, by merging the tracks),
 - `chord_iterator.py` iterates through a song by chord, and
 - `time_iterator.py` iterates through a song by time instance (what is playing at a particular moment).
+
+`piano_roll.py` turns a song into a dense (time step x pitch) NumPy matrix, and `sweep.py` finds the chords that are
+on with a sweep line; TimeIterator can iterate with either (see `benchmark.py` to compare them).
+
+All three iterators accept a Song, or a LoadedSong from `loader.py` whose tracks and notes have been fetched once
+and can be shared between iterators. For read-only iteration, `records.py` loads compact NoteRecords instead of
+ORM Notes, and writes analysis labels back by note id.
 """
 
-from song_iterator import SongIterator
+from loader import LoadedSong,load_song
+from records import NoteRecord,labels,write_labels
+from song_iterator import SongIterator,StreamingSongIterator
 from chord_iterator import ChordIterator
 from time_iterator import TimeIterator
+from piano_roll import PianoRoll
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Compare the speed of the TimeIterator modes on MIDI files (long, dense orchestral pieces show the differences best).
+
+    $ python -m iter.benchmark [-d DURK_STEP] [-m MODES] [-f] FILE.mid [FILE.mid ...]
+
+where:
+    - DURK_STEP is the number of durks between TimeInstances (default 4)
+    - MODES is a comma separated list of TimeIterator modes (default chords,roll,sweep,events)
+    - `-f` reads files with the streaming NumPy reader (see db.smf) instead of python-midi
+
+The files are parsed in memory (nothing is stored in the database). For every file and mode, the time to iterate
+through the whole song and the number of TimeInstances are printed.
+"""
+
+import time
+from optparse import OptionParser
+
+from db import Song,Track,Note
+from db.bulk import TRACK_COLUMNS,NOTE_COLUMNS
+from db.helpers import MidiParser
+from loader import load_song
+from time_iterator import TimeIterator
+
+def song_from_midi(parser,midifilename):
+    """
+    Parse a MIDI file into Song / Track / Note objects that are not attached to a database session
+
+    Args:
+        parser (MidiParser): the parser
+        midifilename: filename of the MIDI file
+
+    Returns:
+        Song: the song
+    """
+    title,resolution,tracks = parser.midi_to_rows(midifilename,rests=False)
+    song = Song(title=title, ppqn=resolution)
+    for track_row,note_rows in tracks:
+        track = Track(song=song, **dict(zip(TRACK_COLUMNS,track_row)))
+        for row in note_rows:
+            Note(track=track, **dict(zip(NOTE_COLUMNS,row)))
+    return song
+
+def bench(song,durk_step,mode):
+    """
+    Time a full iteration through a song
+
+    Args:
+        song (LoadedSong): the song
+        durk_step (int): number of durks between TimeInstances
+        mode (str): the TimeIterator mode
+
+    Returns:
+        tuple: (seconds, number of TimeInstances, number of notes over all TimeInstances)
+    """
+    start = time.time()
+    count,notes = 0,0
+    for ts in TimeIterator(song,durk_step,mode):
+        count += 1
+        notes += len(ts.notes())
+    return time.time() - start,count,notes
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option("-d", "--durk-step", dest="durk_step", default=4, type="int")
+    parser.add_option("-m", "--modes", dest="modes", default="chords,roll,sweep,events")
+    parser.add_option("-f", "--fast-parser", dest="fast", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    midi_parser = MidiParser(options.fast)
+    for midifilename in args:
+        song = load_song(song_from_midi(midi_parser,midifilename))
+        print "%s: %d notes" % (midifilename, len(song.playing))
+        for mode in options.modes.split(','):
+            elapsed,count,notes = bench(song,options.durk_step,mode)
+            print "\t%-8s %8.3fs %8d instances %10d notes" % (mode, elapsed, count, notes)
+
+if __name__ == '__main__':
+    main()
@@ -67,7 +67,7 @@ class ChordIterator(object):
         Construct a new ChordIterator
 
         Args:
-            song: the song through which to iterate
+            song: the song (Song or LoadedSong) through which to iterate
         """
         self.indx = 0
 
@@ -0,0 +1,87 @@
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db import Track,Note
+from records import load_records
+
+class LoadedSong(object):
+    """
+    A Song whose tracks and notes have been loaded up front (see load_song), shared by the iterators so that a
+    song is only read from the database once.
+    """
+    def __init__(self,song,tracks,notes):
+        """
+        Args:
+            song (Song): the song
+            tracks (Track[]): the tracks of the song
+            notes (Note[]): the notes of all tracks, rests included
+        """
+        self.song = song
+        self.tracks = tuple(tracks)
+
+        self.notes = tuple(sorted(notes,key=lambda n: (n.start,n.dur)))
+        """tuple: all Notes of the song (rests included), ordered by (start, dur)"""
+
+        self.playing = tuple(note for note in self.notes if note.pitch != -1)
+        """tuple: the Notes of self.notes that are not rests"""
+
+    def bounds(self):
+        """
+        The span of time iterated over by TimeIterator: from the start of the note that ends first to the end of
+        the last note (rests included)
+
+        Returns:
+            tuple: (first time, end time) in durks
+
+        Raises:
+            ValueError: if the song has no notes
+        """
+        first_note = min(self.notes, key=lambda note: note.start + note.dur)
+        last_note = max(self.notes, key=lambda note: note.start + note.dur)
+        return first_note.start,last_note.start + last_note.dur
+
+    def __repr__(self):
+        return "LoadedSong(song=%r, len(notes)=%r)" % (self.song, len(self.notes))
+
+def load_song(song,records=False):
+    """
+    Load the tracks and notes of a song with two queries (instead of one query per track).
+
+    Song.tracks and Track.notes are populated with the results, so code walking the relationships afterwards
+    does not hit the database either.
+
+    With records=True, the song is loaded read-only: its tracks and notes are TrackRecords and NoteRecords
+    (see records.py), which take a fraction of the memory of ORM objects. Labels set on them are written back
+    with records.write_labels.
+
+    Args:
+        song: the Song to load, or an already LoadedSong
+        records: if True, load NoteRecords rather than Notes
+
+    Returns:
+        LoadedSong: the loaded song
+    """
+    if isinstance(song,LoadedSong):
+        return song
+
+    session = object_session(song)
+    if records:
+        tracks,notes = load_records(session,song.id)
+        return LoadedSong(song,tracks,notes)
+
+    if session is None:
+        # a song that is not attached to a database: walk the relationships
+        tracks = list(song.tracks)
+        return LoadedSong(song,tracks,[note for trk in tracks for note in trk.notes])
+
+    tracks = session.query(Track).filter(Track.song_id == song.id).order_by(Track.id).all()
+    notes = session.query(Note).join(Track).filter(Track.song_id == song.id).order_by(Note.track_id,Note.id).all()
+
+    by_track = dict((trk.id,[]) for trk in tracks)
+    for note in notes:
+        by_track[note.track_id].append(note)
+    for trk in tracks:
+        set_committed_value(trk,'notes',by_track[trk.id])
+    set_committed_value(song,'tracks',tracks)
+
+    return LoadedSong(song,tracks,notes)
@@ -0,0 +1,160 @@
+import numpy as np
+
+from chord_iterator import Chord
+from loader import load_song
+
+NUM_PITCHES = 128
+
+class PianoRoll(object):
+    """
+    A dense, time step x pitch representation of a song.
+
+    Row i of every plane is the moment self.times[i]. The time steps are those of a TimeIterator with the same
+    durk_step: from the start of the note that ends first, up to (excluding) the end of the last note.
+    A note is on at time t if note.start <= t <= note.start + note.dur (as in Chord.on_at_time).
+    """
+    def __init__(self,song,durk_step,onsets=False,tracks=False):
+        """
+        Build the piano roll of a song
+
+        Args:
+            song: the song (Song or LoadedSong)
+            durk_step (int): number of durks between time steps
+            onsets (bool): also build self.onsets
+            tracks (bool): also build self.track_active
+
+        Raises:
+            ValueError: if the song has no notes
+        """
+        song = load_song(song)
+
+        self.song = song
+        self.durk_step = durk_step
+
+        self.notes = song.playing
+        """tuple: the Notes of the song (rests excluded), ordered by (start, dur)"""
+
+        # the time steps, as in TimeIterator
+        t0,max_time = song.bounds()
+        self.times = np.arange(t0, max_time, durk_step)
+        """numpy.ndarray: the time (in durks) of every step"""
+        num_steps = len(self.times)
+
+        start = np.array([note.start for note in self.notes], dtype='i8')
+        end = start + np.array([note.dur for note in self.notes], dtype='i8')
+        pitch = np.array([note.pitch for note in self.notes], dtype='i8')
+
+        # the steps during which each note is on: the first step at / after its start, to the last one at / before its end
+        first = np.maximum(-((t0 - start) // durk_step), 0)
+        last = np.minimum((end - t0) // durk_step, num_steps - 1)
+        counts = np.maximum(last - first + 1, 0)
+
+        # one (step, note) pair per step a note is on
+        pair_note = np.repeat(np.arange(len(self.notes)), counts)
+        pair_step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - first, counts)
+
+        self.active = np.zeros((num_steps, NUM_PITCHES), dtype=bool)
+        """numpy.ndarray: (steps, 128) True where a pitch is on"""
+        self.active[pair_step, pitch[pair_note]] = True
+
+        # the notes on at each step, grouped by step (and in note order within a step)
+        by_step = np.argsort(pair_step, kind='mergesort')
+        self.step_notes = pair_note[by_step]
+        self.step_offsets = np.searchsorted(pair_step[by_step], np.arange(num_steps + 1))
+
+        self.onsets = None
+        """numpy.ndarray: (steps, 128) True where a note starts during the step (times[i] <= start < times[i] + durk_step)"""
+        if onsets:
+            self.onsets = np.zeros((num_steps, NUM_PITCHES), dtype=bool)
+            step = (start - t0) // durk_step
+            inside = (start >= t0) & (step < num_steps)
+            self.onsets[step[inside], pitch[inside]] = True
+
+        self.track_active = None
+        """numpy.ndarray: (tracks, steps, 128) self.active split by track, in the order of song.tracks"""
+        if tracks:
+            track_index = dict((trk.id, i) for i,trk in enumerate(song.tracks))
+            track = np.array([track_index[note.track_id] for note in self.notes], dtype='i8')
+            self.track_active = np.zeros((len(song.tracks), num_steps, NUM_PITCHES), dtype=bool)
+            self.track_active[track[pair_note], pair_step, pitch[pair_note]] = True
+
+    def __len__(self):
+        return len(self.times)
+
+    def step(self,time):
+        """
+        Find the step of a time
+
+        Args:
+            time (int): the time in durks
+
+        Returns:
+            int: index of the last step at / before time
+        """
+        return int((time - self.times[0]) // self.durk_step)
+
+    def window(self,start,end):
+        """
+        The rows of the steps between two times
+
+        Args:
+            start (int): first time (in durks), included
+            end (int): last time (in durks), excluded
+
+        Returns:
+            numpy.ndarray: a view of self.active
+        """
+        return self.active[max(-((self.times[0] - start) // self.durk_step), 0):max(self.step(end - 1) + 1, 0)]
+
+    def notes_at(self,i):
+        """
+        The notes that are on at a step
+
+        Args:
+            i: index of the step
+
+        Returns:
+            Note[]: the notes, ordered by (start, dur)
+        """
+        return [self.notes[j] for j in self.step_notes[self.step_offsets[i]:self.step_offsets[i + 1]]]
+
+class RollInstance(object):
+    """
+    A TimeInstance backed by a row of a PianoRoll (see TimeIterator's 'roll' mode)
+    """
+    weight = 1
+
+    def __init__(self,roll,i):
+        """
+        Args:
+            roll (PianoRoll): the piano roll
+            i: index of the step
+        """
+        self.roll = roll
+        self.indx = i
+        self.time = int(roll.times[i])
+
+    def __repr__(self):
+        return "<RollInstance len(pitches)=%r, time=%r>" % (int(self.pitches.sum()), self.time)
+
+    @property
+    def pitches(self):
+        """numpy.ndarray: a view of the row of the piano roll, True where a pitch is on"""
+        return self.roll.active[self.indx]
+
+    @property
+    def chords(self):
+        """Chord[]: the notes that are on, grouped into chords"""
+        chords = []
+        for note in self.notes():
+            if not chords or not chords[-1].add(note):
+                chord = Chord()
+                chord.add(note)
+                chords.append(chord)
+        return chords
+
+    def notes(self):
+        """
+        The Notes that are on at this moment in time (each note once)
+        """
+        return self.roll.notes_at(self.indx)
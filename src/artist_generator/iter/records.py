@@ -0,0 +1,126 @@
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import Session
+
+from db import Track,Note
+
+LABEL_BATCH_SIZE = 5000
+"""int: number of labels per UPDATE ... FROM (VALUES ...) statement (see write_labels)"""
+
+# the VALUES list may be all NULLs for a column, which PostgreSQL then types as text: cast back explicitly
+_UPDATE_FROM_VALUES = "UPDATE note SET root = v.root::integer, iso_root = v.iso_root::varchar, " \
+                      "roman = v.roman::integer FROM (VALUES %s) AS v (id, root, iso_root, roman) WHERE note.id = v.id"
+
+class TrackRecord(object):
+    """
+    The part of a Track that analysis needs, as a plain object (see load_records)
+    """
+    __slots__ = ('id','key_sig_top','key_sig_bottom')
+
+    def __init__(self,id,key_sig_top,key_sig_bottom):
+        self.id = id
+        self.key_sig_top = key_sig_top
+        self.key_sig_bottom = key_sig_bottom
+
+    def __repr__(self):
+        return "TrackRecord(id=%r, ks=%r/%r)" % (self.id, self.key_sig_top, self.key_sig_bottom)
+
+class NoteRecord(object):
+    """
+    The part of a Note that iteration and analysis need, as a plain object (see load_records).
+
+    Unlike a Note, a NoteRecord is not tracked by a session: setting root / iso_root / roman changes nothing in
+    the database until the labels are written back (see labels and write_labels).
+    """
+    __slots__ = ('id','pitch','iso_pitch','start','dur','track_id','track','root','iso_root','roman')
+
+    def __init__(self,id,pitch,iso_pitch,start,dur,track,root=None,iso_root=None,roman=None):
+        self.id = id
+        self.pitch = pitch
+        self.iso_pitch = iso_pitch
+        self.start = start
+        self.dur = dur
+        self.track_id = track.id
+        self.track = track
+        self.root = root
+        self.iso_root = iso_root
+        self.roman = roman
+
+    def __repr__(self):
+        return "NoteRecord(id=%r, pitch=%r, iso_pitch=%r, dur=%r, start=%r, root=%r, iso_root=%r)" % \
+            (self.id, self.pitch, self.iso_pitch, self.dur, self.start, self.root, self.iso_root)
+
+def load_records(connection,song_id):
+    """
+    Read the tracks and notes of a song as TrackRecords and NoteRecords, with two queries and without the ORM
+
+    Args:
+        connection: a connection or session
+        song_id: id of the song
+
+    Returns:
+        tuple: (TrackRecord[], NoteRecord[])
+    """
+    track_t,note_t = Track.__table__,Note.__table__
+
+    tracks = [TrackRecord(*row) for row in connection.execute(
+        select([track_t.c.id,track_t.c.key_sig_top,track_t.c.key_sig_bottom])
+        .where(track_t.c.song_id == song_id).order_by(track_t.c.id))]
+    by_id = dict((trk.id,trk) for trk in tracks)
+
+    query = select([note_t.c.id,note_t.c.pitch,note_t.c.iso_pitch,note_t.c.start,note_t.c.dur,note_t.c.track_id,
+                    note_t.c.root,note_t.c.iso_root,note_t.c.roman]) \
+        .select_from(note_t.join(track_t)).where(track_t.c.song_id == song_id) \
+        .order_by(note_t.c.track_id,note_t.c.id)
+    notes = [NoteRecord(row[0],row[1],row[2],row[3],row[4],by_id[row[5]],row[6],row[7],row[8])
+             for row in connection.execute(query)]
+
+    return tracks,notes
+
+def labels(notes):
+    """
+    Collect the analysis results of notes, keyed by note id
+
+    Args:
+        notes: the (labelled) NoteRecords
+
+    Returns:
+        list: (id, root, iso_root, roman) of every note with a root
+    """
+    return [(note.id,note.root,note.iso_root,note.roman) for note in notes if note.root is not None]
+
+def write_labels(connection,results):
+    """
+    Write analysis results back to the note table.
+
+    On PostgreSQL, the labels are sent as a single UPDATE ... FROM (VALUES ...) statement (per LABEL_BATCH_SIZE
+    labels), rather than as one UPDATE per note. Other backends run an executemany UPDATE.
+    Nothing is committed: the caller commits, e.g. along with the analyzed flag of the song.
+
+    Args:
+        connection: a connection or session (the update joins its transaction)
+        results: (id, root, iso_root, roman) tuples (see labels)
+
+    Returns:
+        int: number of notes updated
+    """
+    if not results:
+        return 0
+
+    conn = connection.connection() if isinstance(connection,Session) else connection
+
+    if conn.dialect.name == 'postgresql':
+        cursor = conn.connection.cursor()
+        try:
+            for i in xrange(0,len(results),LABEL_BATCH_SIZE):
+                values = ','.join(cursor.mogrify("(%s,%s,%s,%s)",row) for row in results[i:i + LABEL_BATCH_SIZE])
+                cursor.execute(_UPDATE_FROM_VALUES % values)
+        finally:
+            cursor.close()
+        return len(results)
+
+    note_t = Note.__table__
+    update = note_t.update().where(note_t.c.id == bindparam('note_id')) \
+        .values(root=bindparam('root'),iso_root=bindparam('iso_root'),roman=bindparam('roman'))
+    conn.execute(update,[{'note_id': i, 'root': root, 'iso_root': iso_root, 'roman': roman}
+                         for i,root,iso_root,roman in results])
+    return len(results)
@@ -1,6 +1,19 @@
 from db import get_sessions,Song,Track,Note
 from optparse import OptionParser
 
+import heapq
+from audiolazy import midi2str
+from sqlalchemy import select
+from sqlalchemy.orm import object_session
+
+from db.columnar import NULL_VALUE
+from db.streaming import BATCH_SIZE
+from loader import load_song
+from records import TrackRecord,NoteRecord
+
+ISO_PITCHES = [midi2str(pitch) for pitch in xrange(128)]
+"""str[]: iso_pitch of every MIDI pitch (as stored by db.helpers)"""
+
 class SongIterator(object):
     """
     Iterate through a song, Note by Note
@@ -10,17 +23,12 @@ class SongIterator(object):
         Initialize a SongIterator
 
         Args:
-            song: the song through which to iterate
+            song: the song (Song or LoadedSong) through which to iterate
         """
         self.indx = 0
 
-        # get all the notes in the piece
-        self.notes = []
-        for trk in song.tracks:
-            for note in trk.notes:
-                self.notes.append(note)
-
-        self.notes.sort(key=lambda n: (n.start,n.dur))
+        # get all the notes in the piece, ordered by (start, dur)
+        self.notes = load_song(song).notes
 
     def __iter__(self):
         return self
@@ -45,6 +53,120 @@ class SongIterator(object):
         else:
             return note
 
+def merge_tracks(tracks):
+    """
+    Merge the notes of several tracks, each ordered by (start, dur), into one stream ordered by (start, dur),
+    keeping one note per track in memory. Ties go to the earlier track.
+
+    Args:
+        tracks: one iterator of notes per track
+
+    Returns:
+        iterator: the notes
+    """
+    heap = []
+    for i,notes in enumerate(tracks):
+        notes = iter(notes)
+        note = next(notes,None)
+        if note is not None:
+            heap.append(((note.start,note.dur,i),note,notes))
+    heapq.heapify(heap)
+
+    while heap:
+        (start,dur,i),note,notes = heap[0]
+        yield note
+
+        note = next(notes,None)
+        if note is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap,((note.start,note.dur,i),note,notes))
+
+def _db_track_notes(connection,track,batch_size):
+    """
+    Stream the notes (rests excluded) of a track, ordered by (start, dur), through a server-side cursor
+
+    Args:
+        connection: the database connection
+        track (TrackRecord): the track
+        batch_size: number of notes fetched at a time
+
+    Returns:
+        iterator: the NoteRecords
+    """
+    note_t = Note.__table__
+    query = select([note_t.c.id,note_t.c.pitch,note_t.c.iso_pitch,note_t.c.start,note_t.c.dur,
+                    note_t.c.root,note_t.c.iso_root,note_t.c.roman]) \
+        .where((note_t.c.track_id == track.id) & (note_t.c.pitch != -1)) \
+        .order_by(note_t.c.start,note_t.c.dur,note_t.c.id)
+
+    res = connection.execution_options(stream_results=True).execute(query)
+    while True:
+        rows = res.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield NoteRecord(row[0],row[1],row[2],row[3],row[4],track,row[5],row[6],row[7])
+
+def _columnar_track_notes(store,j,track):
+    """
+    Read the notes of a track from a columnar store (see db.columnar)
+
+    Args:
+        store (ColumnarStore): the store
+        j: row of the track in store.tracks
+        track (TrackRecord): the track
+
+    Returns:
+        iterator: the NoteRecords
+    """
+    for row in store.track_notes(j):
+        pitch,root,roman = int(row['pitch']),int(row['root']),int(row['roman'])
+        yield NoteRecord(int(row['id']),pitch,ISO_PITCHES[pitch],int(row['start']),int(row['dur']),track,
+                         None if root == NULL_VALUE else root,None,None if roman == NULL_VALUE else roman)
+
+class StreamingSongIterator(object):
+    """
+    Iterate through a song, Note by Note, without loading it: the notes of every track are read in (start, dur)
+    order (using the (track_id, start) index, or a columnar store) and merged with a heap. Memory is bounded by
+    the number of tracks, and the first note is available right away.
+
+    Notes come out as NoteRecords (see records.py), in the same order as from a SongIterator.
+    """
+    def __init__(self,song,store=None,batch_size=BATCH_SIZE):
+        """
+        Initialize a StreamingSongIterator
+
+        Args:
+            song: the Song through which to iterate (read through its session), or with store, the row of the
+                song in store.songs
+            store (ColumnarStore): read the notes from this columnar store instead of the database
+            batch_size: number of notes fetched from the database at a time, per track
+        """
+        if store is not None:
+            offset = store.songs[song]['track_offset']
+            tracks = [(offset + k,TrackRecord(int(row['id']),int(row['key_sig_top']),int(row['key_sig_bottom'])))
+                      for k,row in enumerate(store.song_tracks(song))]
+            self.notes = merge_tracks(_columnar_track_notes(store,j,track) for j,track in tracks)
+        else:
+            track_t = Track.__table__
+            connection = object_session(song).connection()
+            tracks = [TrackRecord(*row) for row in connection.execute(
+                select([track_t.c.id,track_t.c.key_sig_top,track_t.c.key_sig_bottom])
+                .where(track_t.c.song_id == song.id).order_by(track_t.c.id))]
+            self.notes = merge_tracks([_db_track_notes(connection,track,batch_size) for track in tracks])
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """
+        Determine the next Note in the Song
+        Returns:
+            NoteRecord: the next note
+        """
+        return next(self.notes)
+
 # when this file is run directly: used for debugging!
 if __name__ == '__main__':
     parser = OptionParser()
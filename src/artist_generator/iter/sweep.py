@@ -0,0 +1,134 @@
+import heapq
+import numpy as np
+
+from chord_iterator import ChordIterator
+from loader import load_song
+
+class SweepLine(object):
+    """
+    An event-driven sweep over the chords of a song.
+
+    Chords enter an active heap (keyed by end time) as the sweep passes their start, and leave it once the sweep
+    passes their end, so every chord is pushed and popped once: sampling a song costs O((n + steps) log n)
+    instead of re-checking every candidate chord at every step. A chord is active at time t if
+    chord.start <= t <= chord.end_time() (as in Chord.on_at_time).
+    """
+    def __init__(self,song):
+        """
+        Prepare the sweep
+
+        Args:
+            song: the song (Song or LoadedSong)
+
+        Raises:
+            ValueError: if the song has no notes
+        """
+        self.song = load_song(song)
+
+        # (first time, end time) of the song. Raises ValueError for songs without notes, like TimeIterator
+        self.bounds = self.song.bounds()
+
+        # chords in order of start time (as built by ChordIterator)
+        self.chords = [chord for chord in ChordIterator(self.song).chords if chord.notes]
+        self.starts = np.array([chord.start for chord in self.chords], dtype='i8')
+        self.ends = np.array([chord.end_time() for chord in self.chords], dtype='i8')
+
+    def steps(self,durk_step):
+        """
+        The sampling times of a TimeIterator with the given step
+
+        Args:
+            durk_step (int): number of durks between samples
+
+        Returns:
+            numpy.ndarray: the times
+        """
+        return np.arange(self.bounds[0],self.bounds[1],durk_step)
+
+    def events(self):
+        """
+        The times at which a chord starts or ends, i.e. where the set of active chords can change
+
+        Returns:
+            numpy.ndarray: the sorted, distinct times
+        """
+        return np.unique(np.concatenate((self.starts,self.ends)))
+
+    def sweep(self,times):
+        """
+        Find the chords active at each of a series of times
+
+        Args:
+            times: non-decreasing times (e.g. steps() or events())
+
+        Returns:
+            iterator: (time, active chords in order of start) for every time
+        """
+        active = []  # heap of (end time, index of the chord)
+        nxt = 0
+        for time in times:
+            time = int(time)
+
+            # chords starting by now
+            while nxt < len(self.chords) and self.starts[nxt] <= time:
+                heapq.heappush(active,(self.ends[nxt],nxt))
+                nxt += 1
+
+            # chords that ended before now
+            while active and active[0][0] < time:
+                heapq.heappop(active)
+
+            yield time,[self.chords[i] for end,i in sorted(active,key=lambda item: item[1])]
+
+    def runs(self,durk_step):
+        """
+        Compress the TimeInstances of sweep(steps(durk_step)) into weighted runs.
+
+        The set of active chords only changes at events(): it is constant at every event, and in between two
+        events. Each of these pieces stands for the steps that fall into it; pieces without steps are dropped,
+        and consecutive pieces with the same chords are merged. A run of weight w stands for w consecutive steps
+        with the same chords, so scores that only depend on the notes (see analyze.preference_rules) can be
+        computed once per run and multiplied by w.
+
+        Args:
+            durk_step (int): number of durks between steps
+
+        Returns:
+            iterator: (time of the first step, active chords in order of start, number of steps) for every run
+        """
+        t0 = self.bounds[0]
+        num_steps = len(self.steps(durk_step))
+
+        def before(time):
+            # number of steps before time
+            return min(max(-((t0 - time) // durk_step),0),num_steps)
+
+        def pieces():
+            # (first step, number of steps, active chords) of every piece, in order of time
+            events = self.events()
+            if not len(events):
+                yield 0,num_steps,[]
+                return
+            yield 0,before(events[0]),[]
+            for i,(time,chords) in enumerate(self.sweep(events)):
+                yield before(time),before(time + 1) - before(time),chords
+
+                # the chords ending at this event are off until the next one
+                end = events[i + 1] if i + 1 < len(events) else None
+                first = before(time + 1)
+                yield first,(before(end) if end is not None else num_steps) - first, \
+                    [chord for chord in chords if chord.end_time() > time]
+
+        run = None
+        for first,weight,chords in pieces():
+            if weight <= 0:
+                continue
+            if run and len(run[1]) == len(chords) and all(a is b for a,b in zip(run[1],chords)):
+                run[2] += weight
+                continue
+            if run:
+                yield tuple(run)
+            run = [int(t0 + first * durk_step),chords,weight]
+        if run:
+            yield tuple(run)
+
@@ -1,17 +1,22 @@
 from db import get_sessions,Song,Track,Note
 from optparse import OptionParser
 
-from song_iterator import SongIterator
 from chord_iterator import ChordIterator
+from loader import load_song
+from piano_roll import PianoRoll,RollInstance
+from sweep import SweepLine
 
 class TimeInstance(object):
     """
     TimeInstance: the set of chords "on" at a specific moment in time during a song
     """
-    def __init__(self,time,chords):
+    def __init__(self,time,chords,weight=1):
         self.time = time
         self.chords = chords
 
+        # the number of steps this TimeInstance stands for (see the 'runs' mode of TimeIterator)
+        self.weight = weight
+
     def __repr__(self):
         return "<TimeInstance len(chords)=%r, time=%r>" % (len(self.chords), self.time)
 
@@ -28,31 +33,57 @@ class TimeInstance(object):
 class TimeIterator(object):
     """
     Iterate through a song, TimeInstance by TimeInstance.
+
+    Modes:
+
+    - 'chords' (default): keep track of the chords that might still be playing from one step to the next,
+    - 'roll': turn the song into a PianoRoll first; the TimeInstances are RollInstances, views of its rows,
+    - 'sweep': find the chords that are on with a SweepLine (see sweep.py), and
+    - 'events': like 'sweep', but with a TimeInstance at every time a chord starts or ends, instead of every
+      durk_step durks.
+    - 'runs': like 'sweep', but consecutive steps with the same chords are merged into one TimeInstance, whose
+      weight is the number of steps it stands for (see SweepLine.runs).
+
+    The 'roll', 'sweep', 'events' and 'runs' modes list every chord / note that is on once, and always run to
+    the end of the song.
     """
-    def __init__(self,song,durk_step):
+    def __init__(self,song,durk_step,mode='chords'):
         """
         Initialize a TimeIterator
 
         Args:
-            song (Song): the song to iterate through
+            song: the song (Song or LoadedSong) to iterate through
             durk_step (int): number of durks between TimeInstances
+            mode (str): 'chords', 'roll', 'sweep', 'events' (durk_step is then ignored) or 'runs'
         """
 
         # durk_step is the step size between TimeInstances.
         self.durk_step = durk_step
+        self.mode = mode
+
+        # load the song once, and share it with the ChordIterator / PianoRoll
+        song = load_song(song)
+        if mode == 'roll':
+            self.roll = PianoRoll(song,durk_step)
+            self.indx = 0
+            return
+        elif mode in ('sweep','events'):
+            sweep = SweepLine(song)
+            self.instances = sweep.sweep(sweep.events() if mode == 'events' else sweep.steps(durk_step))
+            return
+        elif mode == 'runs':
+            self.instances = SweepLine(song).runs(durk_step)
+            return
+        elif mode != 'chords':
+            raise ValueError("unknown TimeIterator mode: %r" % mode)
 
-        # construct the ChordIterator
         self.chord_iterator = ChordIterator(song)
 
         self.current_ts = None
         self.chords_to_consider = []
 
         # start at min_time. end at max_time
-        all_notes = SongIterator(song).notes
-        first_note = min(all_notes, key=lambda note: note.start + note.dur)
-        self.time = first_note.start
-        last_note = max(all_notes,key=lambda note: note.start + note.dur)
-        self.max_time = last_note.start + last_note.dur
+        self.time,self.max_time = song.bounds()
 
     def __iter__(self):
         return self
@@ -64,6 +95,14 @@ class TimeIterator(object):
         Returns:
             TimeInstance: the next TimeInstance.
         """
+        if self.mode == 'roll':
+            if self.indx >= len(self.roll):
+                raise StopIteration()
+            self.indx += 1
+            return RollInstance(self.roll,self.indx - 1)
+        elif self.mode != 'chords':
+            return TimeInstance(*self.instances.next())
+
         # past the end of the song
         if self.time >= self.max_time:
             raise StopIteration()
@@ -100,6 +139,7 @@ if __name__ == '__main__':
     parser = OptionParser()
 
     parser.add_option("-d", "--durk-step", dest="durk_step", default=4, type="int")
+    parser.add_option("-m", "--mode", dest="mode", default="chords", help="'chords', 'roll', 'sweep', 'events' or 'runs'")
     parser.add_option("-t", "--pool-size", dest="pool_size", default=8, type="int")
     parser.add_option("-u", "--username", dest="db_username", default="postgres")
     parser.add_option("-p", "--password", dest="db_password", default="postgres")
@@ -112,5 +152,5 @@ if __name__ == '__main__':
 
     # grab the song from the database and just print out all timestamps.
     song = sessions[options.which_db].query(Song).get(options.which_song)
-    for ts in TimeIterator(song,options.durk_step):
+    for ts in TimeIterator(song,options.durk_step,options.mode):
         print ts
\ No newline at end of file
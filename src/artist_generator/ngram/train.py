@@ -22,7 +22,8 @@ from collections import deque
 
 from sqlalchemy import desc, asc
 
-from db import Song, Track, Note, get_sessions
+from db import Song, Track, Note, EngineRegistry
+from db.streaming import stream
 from ngram_helper import key_transpose_pitch
 from exceptions import InvalidKeySignature
 
@@ -48,6 +49,8 @@ class RomanTrainer(object):
         self.rt_id = rt_id
 
         self.counts = counts
+        # (pitch, (key_sig_top, key_sig_bottom)) of the last notes: plain values, as the notes themselves are
+        # expunged from the session once their batch of tracks is done
         self.triple = deque()
         self.options = options
 
@@ -62,10 +65,8 @@ class RomanTrainer(object):
             int[]: the transposed triple
         """
         res = []
-        notes = list(self.triple)
-        for note in notes:
-            src_key = (note.track.key_sig_top,note.track.key_sig_bottom)
-            res.append(key_transpose_pitch(note.pitch,src_key,self.dest_key))
+        for pitch,src_key in self.triple:
+            res.append(key_transpose_pitch(pitch,src_key,self.dest_key))
 	return res
 
     def train(self,note):
@@ -75,7 +76,7 @@ class RomanTrainer(object):
         Args:
             note: the note to train on
         """
-        self.triple.append(note)
+        self.triple.append((note.pitch,(note.track.key_sig_top,note.track.key_sig_bottom)))
 
         if len(self.triple) > 3:
             # remove the old note
@@ -99,16 +100,17 @@ class TrackTrainer(Process):
     """
     Separate process to train ngram models, all music sourcing from one database
     """
-    def __init__(self,p_id,session,options):
+    def __init__(self,p_id,engines,options):
         """
         Initialize the TrackTrainer process
         Args:
-            p_id: process id
-            session: the database session to load from
+            p_id: process id, also the index of the database to load from
+            engines (EngineRegistry): the database engines. The engine is created once the process is running.
             options (dict): options passed to script
         """
         Process.__init__(self)
-        self.session = session
+        self.p_id = p_id
+        self.engines = engines
         self.options = options
 
         self.rts = []
@@ -123,8 +125,11 @@ class TrackTrainer(Process):
         """
         Start the process, training on each track separately
         """
-        # iterate through all the tracks
-        for trk in self.session.query(Track).all():
+        self.session = self.engines.session(int(self.p_id))
+
+        # stream through all the tracks
+        # (small batches: the notes of every track in a batch stay loaded until the batch is done)
+        for trk in stream(self.session,self.session.query(Track),batch_size=100):
             self.train(trk)
 
         # write all the rts
@@ -180,12 +185,12 @@ def main():
         if not os.path.exists(pt):
             os.mkdir(pt)
 
-    sessions = get_sessions(options.pool_size,options.db_username,options.db_password)
+    engines = EngineRegistry(options.pool_size,options.db_username,options.db_password)
     processes = []
 
     # construct and start the threads
     for i in xrange(options.pool_size):
-        p = TrackTrainer(str(i),sessions[i],options)
+        p = TrackTrainer(str(i),engines,options)
         processes.append(p)
         p.start()
 
@@ -0,0 +1,5 @@
+"""
+Tests, run from src/artist_generator with:
+
+    $ python -m unittest discover -s tests -t .
+"""
@@ -0,0 +1,63 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+from db import Track,Note
+from db.bulk import BulkWriter,TRACK_COLUMNS,NOTE_COLUMNS
+
+class RecordingCursor(object):
+    """
+    A DB-API cursor recording the COPY statements run through copy_expert
+    """
+    def __init__(self,copies):
+        self.copies = copies
+
+    def copy_expert(self,sql,f):
+        self.copies.append((sql,f.read()))
+
+    def close(self):
+        pass
+
+class RecordingConnection(object):
+    """
+    A PostgreSQL connection (as seen by BulkWriter.copy) whose cursors record what they are asked to copy
+    """
+    def __init__(self):
+        self.dialect = PGDialect_psycopg2()
+        self.copies = []
+        self.connection = self
+
+    def cursor(self):
+        return RecordingCursor(self.copies)
+
+class CopyTest(unittest.TestCase):
+    """
+    The COPY statements of the PostgreSQL path of BulkWriter
+    """
+    def setUp(self):
+        self.writer = BulkWriter(create_engine('sqlite://'))
+        self.conn = RecordingConnection()
+
+    def test_note_columns_are_quoted(self):
+        row = (60, 'C4', 8, 0, 8, 120, 0, 0, 1)
+        self.writer.copy(self.conn,Note.__table__,NOTE_COLUMNS + ('track_id',),[row])
+
+        self.assertEqual(self.conn.copies,[
+            ('COPY note (pitch, iso_pitch, dur, start, "end", tick_dur, start_tick, measure, track_id) FROM STDIN',
+             '60\tC4\t8\t0\t8\t120\t0\t0\t1\n')])
+
+    def test_track_rows(self):
+        row = (1, 2, 4, 4, 0, 0, 0, 'Grand\tPiano', 0, 0)
+        self.writer.copy(self.conn,Track.__table__,('id','song_id') + TRACK_COLUMNS,[row])
+
+        self.assertEqual(self.conn.copies,[
+            ('COPY track (id, song_id, time_sig_top, time_sig_bottom, key_sig_top, key_sig_bottom, instr_key, '
+             'instr_name, channel, start_tick) FROM STDIN',
+             '1\t2\t4\t4\t0\t0\t0\tGrand\\tPiano\t0\t0\n')])
+
+    def test_no_rows(self):
+        self.writer.copy(self.conn,Note.__table__,NOTE_COLUMNS + ('track_id',),[])
+        self.assertEqual(self.conn.copies,[])
+
+if __name__ == '__main__':
+    unittest.main()
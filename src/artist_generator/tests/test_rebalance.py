@@ -0,0 +1,82 @@
+import os,shutil,tempfile,unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import Base,Song,Track,Note,Manifest,ShardRouter
+from db.manifest import ManifestIndex,STORED,content_hash,manifest_values
+from db.rebalance import move_song
+
+class MoveSongTest(unittest.TestCase):
+    """
+    Moving a song (with its manifest entry) between two SQLite databases
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.engines = [create_engine('sqlite:///' + os.path.join(self.dir, 'artist_%d.db' % i)) for i in xrange(2)]
+        for engine in self.engines:
+            Base.metadata.create_all(engine)
+
+        # a file the ring places on database 0
+        router = ShardRouter(2)
+        self.path = os.path.join(self.dir, 'song.mid')
+        for i in xrange(1000):
+            with open(self.path, 'wb') as f:
+                f.write('MThd %d' % i)
+            self.digest = content_hash(self.path)
+            if router.route(self.digest) == 0:
+                break
+        st = os.stat(self.path)
+
+        session = sessionmaker(bind=self.engines[0])()
+        song = Song(title='song.mid', ppqn=480)
+        track = Track(song=song, time_sig_top=4, time_sig_bottom=4, key_sig_top=0, key_sig_bottom=0,
+                      instr_key=0, instr_name='piano', channel=0, start_tick=0)
+        for start in xrange(4):
+            Note(track=track, pitch=60 + start, iso_pitch='C4', dur=8, start=8 * start, end=8 * start + 8,
+                 tick_dur=120, start_tick=120 * start, measure=0)
+        session.add(song)
+        session.flush()
+        info = (self.path, st.st_size, st.st_mtime, self.digest)
+        session.add(Manifest(song_id=song.id, **manifest_values(info, STORED, 0)))
+        session.commit()
+        self.song_id = song.id
+        session.close()
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.dispose()
+        shutil.rmtree(self.dir)
+
+    def sessions(self):
+        return [sessionmaker(bind=engine)() for engine in self.engines]
+
+    def test_move_song_with_manifest(self):
+        move_song(self.song_id, self.engines[0], self.engines[1], 1)
+
+        src,dst = self.sessions()
+        self.assertEqual(src.query(Song).count(), 0)
+        self.assertEqual(src.query(Note).count(), 0)
+        self.assertEqual(src.query(Manifest).count(), 0)
+
+        [song] = dst.query(Song).all()
+        self.assertEqual(song.title, 'song.mid')
+        self.assertEqual(sorted(note.pitch for track in song.tracks for note in track.notes), [60, 61, 62, 63])
+
+        [entry] = dst.query(Manifest).all()
+        self.assertEqual((entry.hash, entry.song_id, entry.shard, entry.path),
+                         (self.digest, song.id, 1, self.path))
+
+    def test_moved_song_is_not_ingested_again(self):
+        move_song(self.song_id, self.engines[0], self.engines[1], 1)
+
+        # the file is still placed on database 0, but is skipped: it is in the manifest of database 1
+        index = ManifestIndex(self.sessions())
+        self.assertEqual(ShardRouter(2).route(content_hash(self.path)), 0)
+        self.assertEqual(index.pending([self.path]), [])
+
+        # even once touched (the contents are hashed again)
+        os.utime(self.path, (0, 0))
+        self.assertEqual(index.pending([self.path]), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import random,unittest
+
+from db.bulk import NOTE_COLUMNS
+from db.helpers import MidiParser,DURKS_PER_QUARTER_NOTE
+
+def note_row(start,end):
+    """
+    A note row (see bulk.NOTE_COLUMNS) played from start to end
+    """
+    return (60, 'C4', end - start, start, end, 8 * (end - start), 8 * start, 0)
+
+def baseline_rests(note_rows,time_sig_bottom):
+    """
+    The rest rows of the original MidiParser.insert_rests_into_track, which marked every played durk in a list
+    """
+    max_durk = max(row[NOTE_COLUMNS.index('end')] for row in note_rows)
+    min_durk = min(row[NOTE_COLUMNS.index('start')] for row in note_rows)
+
+    rest_list = [True] * (max_durk + 1)
+    for row in note_rows:
+        start,dur = row[NOTE_COLUMNS.index('start')],row[NOTE_COLUMNS.index('dur')]
+        for durk in xrange(dur):
+            rest_list[start + durk] = False
+
+    rests = []
+    current_durk = min_durk
+    while current_durk < max_durk:
+        if rest_list[current_durk]:
+            rest_start = current_durk
+            while current_durk < max_durk and rest_list[current_durk]:
+                current_durk += 1
+            rest_measure = rest_start / (DURKS_PER_QUARTER_NOTE * time_sig_bottom)
+            rests.append((-1, None, current_durk - rest_start, rest_start, current_durk, -1, -1, rest_measure))
+        else:
+            current_durk += 1
+    return rests
+
+class GetRestsTest(unittest.TestCase):
+    """
+    MidiParser.get_rests gives the same rest rows as the original durk-by-durk algorithm
+    """
+    def setUp(self):
+        self.parser = MidiParser()
+
+    def check(self,intervals,time_sig_bottom=4):
+        rows = [note_row(start,end) for start,end in intervals]
+        rests = self.parser.get_rests(rows,time_sig_bottom)
+        self.assertEqual(rests,baseline_rests(rows,time_sig_bottom))
+        return rests
+
+    def test_no_notes(self):
+        self.assertEqual(self.parser.get_rests([],4),[])
+
+    def test_gap_before_trailing_zero_length_note(self):
+        rests = self.check([(0,4),(10,10)])
+        self.assertEqual(rests,[(-1, None, 6, 4, 10, -1, -1, 0)])
+
+    def test_overlapping_notes(self):
+        self.assertEqual(self.check([(0,10),(2,6),(8,20),(40,48)]),[(-1, None, 20, 20, 40, -1, -1, 0)])
+
+    def test_touching_notes(self):
+        self.assertEqual(self.check([(0,4),(4,8),(8,16)]),[])
+
+    def test_random_tracks(self):
+        rnd = random.Random(0)
+        for i in xrange(500):
+            intervals = []
+            for j in xrange(rnd.randint(1,8)):
+                start = rnd.randint(0,64)
+                intervals.append((start,start + rnd.choice([0,0,1,4,8,16])))
+            self.check(intervals,rnd.choice([2,4,8]))
+
+if __name__ == '__main__':
+    unittest.main()
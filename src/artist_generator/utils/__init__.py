@@ -3,7 +3,9 @@ The utils package contains a series of utilities for running and analyzing other
 
 - `counter.py`: a process-safe counter,
 - `mark_analyzed.py`: a script to mark songs as analyzed (harmonically),
-- `stats.py`: a script to calculate the number of notes, tracks, and songs in our dataset.
+- `stats.py`: a script to calculate the number of notes, tracks, and songs in our dataset,
+- `throughput.py`: process-safe per-stage throughput counters.
 """
 
-from counter import Counter
\ No newline at end of file
+from counter import Counter
+from throughput import Throughput
\ No newline at end of file
@@ -23,6 +23,20 @@ class Counter(object):
             self.val.value += 1
             return self.val.value
 
+    def addAndGet(self, delta):
+        """
+        Atomically add delta to this counter, and return the new value stored.
+
+        Args:
+            delta (int): the amount to add
+
+        Returns:
+            int: The updated value of this counter.
+        """
+        with self.val.get_lock():
+            self.val.value += delta
+            return self.val.value
+
     def value(self):
         """
         Atomically get the current value of this counter.
@@ -3,18 +3,60 @@
 A quick utility script to mark analyzed songs as analyzed.
 A song has been analyzed if any notes contain a non-NULL root.
 
-    $ python -m utils.mark_analyzed [-t DBPOOL_SIZE] [-u USERNAME] [-p PASSWORD]
+    $ python -m utils.mark_analyzed [-t DBPOOL_SIZE] [-u USERNAME] [-p PASSWORD] [-n]
 
 where:
     - DBPOOL_SIZE is the number of databases
     - USERNAME is the database username
     - PASSWORD is the database password
+    - `-n` only reports how many songs would be marked
+
+Every database is updated with a single UPDATE ... WHERE EXISTS (...) statement, and all databases are updated
+concurrently.
 """
 
-from db import get_sessions,Song
+from db import get_engines,ShardSet,Song,Track,Note
 from optparse import OptionParser
-from iter import SongIterator
+from sqlalchemy import select, exists, func, and_
+
+def mark(engine,dry_run=False):
+    """
+    Mark the songs of a database that have an analyzed note (one with a non-NULL root) as analyzed
+
+    Args:
+        engine: the database engine
+        dry_run: if True, only count the songs that would be marked
 
+    Returns:
+        tuple: (number of songs marked, number of songs still to analyze)
+    """
+    song_t,track_t,note_t = Song.__table__,Track.__table__,Note.__table__
+
+    # correlated with the song being updated / counted
+    has_root = exists().where(and_(track_t.c.song_id == song_t.c.id,
+                                   note_t.c.track_id == track_t.c.id,
+                                   note_t.c.root != None))
+    unanalyzed = song_t.c.analyzed.isnot(True)
+
+    conn = engine.connect()
+    try:
+        trans = conn.begin()
+        try:
+            if dry_run:
+                marked = conn.execute(select([func.count()]).select_from(song_t).where(and_(unanalyzed,has_root))).scalar()
+            else:
+                marked = conn.execute(song_t.update().where(and_(unanalyzed,has_root)).values(analyzed=True)).rowcount
+            remaining = conn.execute(select([func.count()]).select_from(song_t).where(unanalyzed)).scalar()
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+    finally:
+        conn.close()
+
+    if dry_run:
+        remaining -= marked
+    return marked,remaining
 
 def main():
     parser = OptionParser()
@@ -22,36 +64,18 @@ def main():
     parser.add_option("-t", "--pool-size", dest="pool_size", default=8, type="int")
     parser.add_option("-u", "--username", dest="db_username", default="postgres")
     parser.add_option("-p", "--password", dest="db_password", default="postgres")
+    parser.add_option("-n", "--dry-run", dest="dry_run", action="store_true", default=False)
     (options, args) = parser.parse_args()
 
-    count = 0
-
-    # iterate through all database sessions
-    for session in get_sessions(options.pool_size,options.db_username,options.db_password):
-        # through all songs and notes
-        for song in session.query(Song).all():
-            print count, ".", song
-            # the song has already been marked as analyzed
-            if song.analyzed:
-                print "\t(song.analyzed == True)"
-                continue
-
-            # check notes in the song
-            for note in SongIterator(song):
-                # if a note has a root, then the song has been analyzed
-                if note.root != None:
-                    song.analyzed = True
-                    break
-
-            # print out the results
-            if song.analyzed:
-                print "\tAlready analyzed."
-            else:
-                print "\tNeed to analyze."
+    # update all databases at once: the work happens in the database servers
+    shards = ShardSet(get_engines(options.pool_size,options.db_username,options.db_password))
+    results = shards.map(lambda engine: mark(engine,options.dry_run))
 
-            session.commit()
-            count += 1
+    verb = "would be" if options.dry_run else "were"
+    for i,(marked,remaining) in enumerate(results):
+        print "artist_%d: %d songs %s marked as analyzed, %d still need to be analyzed." % (i, marked, verb, remaining)
+    print "total: %d songs %s marked as analyzed, %d still need to be analyzed." % \
+        (sum(r[0] for r in results), verb, sum(r[1] for r in results))
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,58 @@
+from multiprocessing import Value
+
+class Throughput(object):
+    """
+    Process-safe throughput counters for one stage of a pipeline:
+
+    - items and rows processed,
+    - seconds spent working (busy), and
+    - seconds spent blocked on the neighbouring stages (waiting).
+
+    A stage that mostly waits is not the bottleneck.
+    """
+    def __init__(self, name):
+        """
+        Initialize the counters
+
+        Args:
+            name (str): name of the stage, used in reports
+        """
+        self.name = name
+        self.items = Value('l', 0)
+        self.rows = Value('l', 0)
+        self.busy = Value('d', 0.0)
+        self.waiting = Value('d', 0.0)
+
+    def record(self, items=0, rows=0, busy=0.0, waiting=0.0):
+        """
+        Atomically add to the counters.
+
+        Args:
+            items (int): number of items processed
+            rows (int): number of rows processed
+            busy (float): seconds spent working
+            waiting (float): seconds spent blocked
+        """
+        with self.items.get_lock():
+            self.items.value += items
+            self.rows.value += rows
+            self.busy.value += busy
+            self.waiting.value += waiting
+
+    def report(self, elapsed):
+        """
+        Summarize the counters
+
+        Args:
+            elapsed (float): wall-clock seconds since the stage started
+
+        Returns:
+            str: a one line report
+        """
+        with self.items.get_lock():
+            items, rows, busy, waiting = self.items.value, self.rows.value, self.busy.value, self.waiting.value
+
+        elapsed = max(elapsed, 1e-6)
+        total = max(busy + waiting, 1e-6)
+        return "%s: %d items (%.1f/sec), %d rows (%.0f/sec), %.0f%% busy" % \
+            (self.name, items, items / elapsed, rows, rows / elapsed, 100 * busy / total)